@@ -0,0 +1,58 @@
+"""
+Query latency and memory of the profile index used for matchmaking.
+
+    python -m benchmarks.bench_match [--profiles N] [--queries N] [--k K]
+
+Fills a ProfileIndex with random moons and lagnas and times top_matches for
+both systems, next to a per-profile loop over match_score (what scoring
+without the pada matrices amounts to) on a small slice for scale.
+"""
+import argparse
+import os
+import time
+
+os.environ.setdefault("BIRTHCHART_WARM_UP", "0")
+
+import numpy as np
+
+import birthchart_web as bw
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--profiles", type=int, default=500_000)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    rng = np.random.default_rng(args.seed)
+
+    index = bw.ProfileIndex()
+    start = time.perf_counter()
+    index.extend(np.arange(args.profiles), rng.integers(0, 2, args.profiles),
+                 rng.uniform(0, 360, args.profiles), rng.uniform(0, 360, args.profiles))
+    build = time.perf_counter() - start
+    columns = sum(column[:len(index)].nbytes for column in index._columns())
+    print(f"{len(index)} profiles indexed in {build * 1000:.1f} ms, {columns / 2**20:.1f} MiB of columns")
+
+    moons = rng.uniform(0, 360, args.queries)
+    sexes = rng.integers(0, 2, args.queries)
+    for system in bw.MATCH_SYSTEMS:
+        timings = []
+        for moon, sex in zip(moons.tolist(), sexes.tolist()):
+            start = time.perf_counter()
+            index.top_matches(moon, sex, args.k, system)
+            timings.append(time.perf_counter() - start)
+        p50, p90 = np.percentile(timings, [50, 90]) * 1000
+        print(f"{system:<11} top {args.k}: p50 {p50:.2f} ms, p90 {p90:.2f} ms per query")
+
+    sample = min(args.profiles, 10_000)
+    longitudes = rng.uniform(0, 360, sample).tolist()
+    start = time.perf_counter()
+    for lon in longitudes:
+        bw.match_score(moons[0], lon)
+    per_profile = (time.perf_counter() - start) / sample
+    print(f"match_score loop: {per_profile * 1e6:.1f} us per profile, "
+          f"~{per_profile * args.profiles * 1000:.0f} ms for {args.profiles} profiles")
+
+if __name__ == "__main__":
+    main()
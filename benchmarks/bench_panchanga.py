@@ -0,0 +1,54 @@
+"""
+Time to generate yearly panchanga calendars.
+
+    python -m benchmarks.bench_panchanga [--year Y] [--cities N] [--workers N]
+
+Times one city's year in-process (sunrise/sunset, the transition search and
+formatting separately), then N cities through iter_panchanga_cities.
+"""
+import argparse
+import os
+import time
+
+os.environ.setdefault("BIRTHCHART_WARM_UP", "0")
+
+import birthchart_web as bw
+
+CITIES = [
+    ("Chennai", 13.08, 80.27, "Asia/Kolkata"), ("Delhi", 28.61, 77.21, "Asia/Kolkata"),
+    ("Mumbai", 19.08, 72.88, "Asia/Kolkata"), ("Kathmandu", 27.72, 85.32, "Asia/Kathmandu"),
+    ("Singapore", 1.35, 103.82, "Asia/Singapore"), ("London", 51.51, -0.13, "Europe/London"),
+    ("New York", 40.71, -74.01, "America/New_York"), ("Tromso", 69.65, 18.96, "Europe/Oslo"),
+]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--year", type=int, default=2026)
+    parser.add_argument("--cities", type=int, default=16)
+    parser.add_argument("--workers", type=int)
+    args = parser.parse_args()
+
+    name, lat, lon, tz = CITIES[0]
+    start = time.perf_counter()
+    sun = bw.sun_times_year(args.year, lat, lon)
+    sun_s = time.perf_counter() - start
+    start = time.perf_counter()
+    transitions = bw.panchanga_transitions(sun[0, 0] - 1, sun[-1, 2] + 2)
+    search_s = time.perf_counter() - start
+    start = time.perf_counter()
+    days = list(bw.panchanga_year(args.year, lat, lon, tz))
+    total_s = time.perf_counter() - start
+    found = ", ".join(f"{len(jds) - 1} {element}" for element, (jds, _) in transitions.items())
+    print(f"{name} {args.year}: {len(days)} days in {total_s * 1000:.0f} ms "
+          f"(sun times {sun_s * 1000:.0f} ms, transitions {search_s * 1000:.0f} ms: {found})")
+
+    cities = [{"name": f"{CITIES[i % len(CITIES)][0]} {i}", "lat": CITIES[i % len(CITIES)][1],
+               "lon": CITIES[i % len(CITIES)][2], "tz": CITIES[i % len(CITIES)][3]} for i in range(args.cities)]
+    start = time.perf_counter()
+    rows = sum(1 for _ in bw.iter_panchanga_cities(cities, args.year, workers=args.workers))
+    elapsed = time.perf_counter() - start
+    print(f"{args.cities} cities, {args.workers or os.cpu_count()} workers: {rows} days in {elapsed:.2f} s "
+          f"({elapsed / args.cities * 1000:.0f} ms per city)")
+
+if __name__ == "__main__":
+    main()
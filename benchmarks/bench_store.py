@@ -0,0 +1,76 @@
+"""
+Ingest rate and query latency of the chart store.
+
+    python -m benchmarks.bench_store [--charts N] [--path FILE] [--repeat N]
+
+Fills a fresh ChartStore with synthetic chart records (random placements and
+their real mahadasha sequence, no ephemeris calls) and times typical queries
+by placement and by mahadasha start.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+os.environ.setdefault("BIRTHCHART_WARM_UP", "0")
+
+import numpy as np
+
+import birthchart_web as bw
+
+QUERIES = [
+    ("moon in Rohini, lagna Simha", {"filters": {"moon_nakshatra": "Rohini", "lagna": "Simha"}}),
+    ("saturn Kumbha, jupiter Meena", {"filters": {"saturn": "Kumbha", "jupiter": "Meena"}}),
+    ("saturn mahadasha next month", {"dasha_lord": "Saturn", "dasha_start": 2461345.5, "dasha_end": 2461375.5}),
+    ("lagna Tula + venus dasha 2027", {"filters": {"lagna": "Tula"}, "dasha_lord": "Venus",
+                                       "dasha_start": 2461406.5, "dasha_end": 2461771.5}),
+]
+
+def synthetic_records(n, seed=0):
+    rng = np.random.default_rng(seed)
+    jds = rng.uniform(2415020.5, 2460676.5, n)
+    longitudes = rng.uniform(0, 360, (n, len(bw.STORE_BODIES)))
+    for i in range(n):
+        moon = longitudes[i, 2]
+        seq_idx, bounds = bw._vim_mahadasha_bounds(moon)
+        yield {
+            "id": i, "birth": "", "jd": jds[i], "latitude": 13.08, "longitude": 80.27, "tz": "Asia/Kolkata",
+            "ayanamsa": bw.DEFAULT_AYANAMSA,
+            "placements": {body: {"longitude": lon} for body, lon in zip(bw.STORE_BODIES, longitudes[i].tolist())},
+            "dasha": [{"lord": bw.VIM_SEQ[(seq_idx + k) % 9], "start_jd": jds[i] + bounds[k], "end_jd": jds[i] + bounds[k + 1]}
+                      for k in range(9)],
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--charts", type=int, default=200_000)
+    parser.add_argument("--path", help="store file (default: a temporary file)")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    path = args.path or os.path.join(tempfile.mkdtemp(), "charts.db")
+    store = bw.ChartStore(path)
+
+    start = time.perf_counter()
+    batch = []
+    for record in synthetic_records(args.charts):
+        batch.append(record)
+        if len(batch) == 10_000:
+            store.ingest(batch)
+            batch = []
+    store.ingest(batch)
+    store.optimize()
+    elapsed = time.perf_counter() - start
+    print(f"ingested {args.charts} charts in {elapsed:.1f} s ({args.charts / elapsed:.0f}/s), "
+          f"{os.path.getsize(path) / 2**20:.0f} MiB")
+
+    for name, query in QUERIES:
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            rows = store.query(limit=100, **query)
+            timings.append(time.perf_counter() - start)
+        p50, p90 = np.percentile(timings, [50, 90]) * 1000
+        print(f"{name:<32} {len(rows):>4} rows  p50 {p50:.2f} ms  p90 {p90:.2f} ms")
+
+if __name__ == "__main__":
+    main()
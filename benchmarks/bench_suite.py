@@ -0,0 +1,187 @@
+"""
+Latency, allocation and memory benchmarks for the chart hot paths.
+
+    python -m benchmarks.bench_suite [--charts N] [--stages a,b,...] [--baseline FILE]
+                                     [--save] [--tolerance 0.25]
+
+Runs each stage over a fixed corpus of synthetic births (geocoding and
+timezone lookup are stubbed, so nothing leaves the process) and reports
+per-call latency percentiles, mean tracemalloc peak per call and the growth
+of the process peak RSS. Results are compared with the stored baseline and
+the run exits non-zero when a stage regresses by more than the tolerance;
+--save replaces the baseline with this run.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import time
+import tracemalloc
+import unittest.mock
+from datetime import datetime, timedelta
+
+os.environ.setdefault("BIRTHCHART_WARM_UP", "0")
+
+import numpy as np
+
+import birthchart_web as bw
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+ALLOC_SAMPLES = 100
+# compared metrics and the smallest absolute change worth flagging
+COMPARED = {"p50_us": 5.0, "p90_us": 5.0, "alloc_kib": 1.0}
+
+def corpus(n, seed=0):
+    """
+    Synthetic births 1900-2050 spread over the inhabited latitudes, each with
+    a fixed-offset timezone from its longitude and a stub place name.
+    """
+    rng = random.Random(seed)
+    births = []
+    for i in range(n):
+        lat, lon = rng.uniform(-55, 65), rng.uniform(-180, 180)
+        offset = -round(lon / 15)
+        local = datetime(1900, 1, 1) + timedelta(minutes=rng.randrange(150 * 365 * 1440))
+        births.append({
+            "place": f"place-{i}",
+            "lat": lat,
+            "lon": lon,
+            "tz": f"Etc/GMT{offset:+d}" if offset else "UTC",
+            "local": local,
+        })
+    return births
+
+def prepare(birth):
+    local = birth["local"]
+    jd, dt, ut_dt = bw.get_julian_day(local.year, local.month, local.day, local.hour, local.minute, 0, birth["tz"])
+    ascendant, cusps = bw.get_ascendant_and_houses(jd, birth["lat"], birth["lon"])
+    positions = bw.get_planet_positions(jd)
+    maandi = bw.get_maandi_longitude(jd, birth["lat"], birth["lon"])
+    return {**birth, "jd": jd, "dt": dt, "ascendant": ascendant, "positions": positions, "maandi": maandi}
+
+def chart_url(b):
+    return f"/chart?dob={b['local']:%Y-%m-%d}&tob={b['local']:%H:%M}&location={b['place']}"
+
+def make_stages(client):
+    # name -> (callable taking a prepared birth, sample size or None for the whole corpus)
+    stages = {
+        "julian_day": (lambda b: bw.get_julian_day(
+            b["local"].year, b["local"].month, b["local"].day, b["local"].hour, b["local"].minute, 0, b["tz"]), None),
+        "houses": (lambda b: bw.get_ascendant_and_houses(b["jd"], b["lat"], b["lon"]), None),
+        "planets": (lambda b: bw.get_planet_positions(b["jd"]), None),
+        "maandi": (lambda b: bw.get_maandi_longitude(b["jd"], b["lat"], b["lon"]), None),
+        "planet_table": (lambda b: bw.get_full_planet_table(b["positions"], b["ascendant"], b["maandi"]), None),
+        "bhava_table": (lambda b: bw.get_bhava_table(b["ascendant"], b["positions"], b["maandi"]), None),
+        "chart_boxes": (lambda b: [
+            bw.html_south_chart(boxes) for boxes in
+            bw.get_divisional_boxes(b["positions"], b["ascendant"], b["maandi"], (1, 9)).values()
+        ], None),
+        "ashtakavarga": (lambda b: bw.calculate_ashtakavarga(b["positions"], b["ascendant"]), None),
+    }
+    for levels in range(1, bw.VIM_LEVELS + 1):
+        stages[f"dasha_L{levels}"] = (
+            lambda b, levels=levels: bw.vimshottari_tree(b["positions"]["Moon"], b["dt"], levels=levels),
+            (None, None, 1000, 200, 20)[levels - 1]
+        )
+    stages["page"] = (lambda b: client.get(chart_url(b)).data, 300)
+    return stages
+
+def peak_rss_kib():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def run_stage(fn, births):
+    fn(births[0])  # first call pays for lazy loads and caches
+    timings = np.empty(len(births))
+    for i, b in enumerate(births):
+        start = time.perf_counter()
+        fn(b)
+        timings[i] = time.perf_counter() - start
+    tracemalloc.start()
+    peaks = []
+    for b in births[:ALLOC_SAMPLES]:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        result = fn(b)
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+        del result
+    tracemalloc.stop()
+    p50, p90, p99 = np.percentile(timings, [50, 90, 99]) * 1e6
+    return {
+        "calls": len(births),
+        "p50_us": round(p50, 1),
+        "p90_us": round(p90, 1),
+        "p99_us": round(p99, 1),
+        "max_us": round(timings.max() * 1e6, 1),
+        "alloc_kib": round(sum(peaks) / len(peaks) / 1024, 1),
+    }
+
+def regressions(results, baseline, tolerance):
+    found = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for metric, min_delta in COMPARED.items():
+            limit = max(base.get(metric, 0) * (1 + tolerance), base.get(metric, 0) + min_delta)
+            if metric in base and result[metric] > limit:
+                found.append(f"{name}.{metric}: {result[metric]} vs baseline {base[metric]}")
+    return found
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--charts", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--stages", help="comma-separated subset of stage names")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    births = [prepare(b) for b in corpus(args.charts, args.seed)]
+    bw._sun_times_cell.cache_clear()  # time Maandi with its sunrise lookups, as on a first request
+    by_place = {b["place"]: bw.GeoLocation(b["place"], b["lat"], b["lon"]) for b in births}
+    tz_by_coords = {(b["lat"], b["lon"]): b["tz"] for b in births}
+    bw.chart_cache = bw.ChartCache(cache_size=0)
+    app = bw.create_app(warm=True)
+    stages = make_stages(app.test_client())
+    selected = args.stages.split(",") if args.stages else list(stages)
+    unknown = set(selected) - set(stages)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}; choose from {', '.join(stages)}")
+
+    results = {}
+    print(f"{'stage':<13} {'calls':>6} {'p50 us':>10} {'p90 us':>10} {'p99 us':>10} {'max us':>10} "
+          f"{'alloc KiB':>10} {'+RSS KiB':>9}")
+    with unittest.mock.patch.object(bw.geocoder, "geocode", lambda place: by_place.get(place)), \
+            unittest.mock.patch.object(bw, "timezone_at", lambda lat, lon: tz_by_coords.get((lat, lon))):
+        for name in selected:
+            fn, sample = stages[name]
+            rss_before = peak_rss_kib()
+            result = run_stage(fn, births[:sample] if sample else births)
+            result["rss_growth_kib"] = peak_rss_kib() - rss_before
+            results[name] = result
+            print(f"{name:<13} {result['calls']:>6} {result['p50_us']:>10.1f} {result['p90_us']:>10.1f} "
+                  f"{result['p99_us']:>10.1f} {result['max_us']:>10.1f} {result['alloc_kib']:>10.1f} "
+                  f"{result['rss_growth_kib']:>9}")
+    print(f"peak RSS {peak_rss_kib() / 1024:.1f} MiB")
+
+    if args.save:
+        with open(args.baseline, "w") as fh:
+            json.dump({"charts": args.charts, "stages": results}, fh, indent=2)
+            fh.write("\n")
+        print(f"baseline written to {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        print("no baseline to compare against (run with --save)")
+        return
+    with open(args.baseline) as fh:
+        baseline = json.load(fh)["stages"]
+    found = regressions(results, baseline, args.tolerance)
+    for line in found:
+        print(f"REGRESSION {line}")
+    sys.exit(1 if found else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Memory and build time of the Vimshottari engines.
+
+    python -m benchmarks.bench_vimshottari [--repeat N]
+
+Compares the nested-dict builder the chart page used before the array engine
+("dict tree"), the NumPy engine itself ("arrays") and vimshottari_tree, which
+now adapts the arrays back into dicts.
+"""
+import argparse
+import os
+import time
+import tracemalloc
+from datetime import datetime
+
+os.environ.setdefault("BIRTHCHART_WARM_UP", "0")
+
+import pytz
+
+import birthchart_web as bw
+
+def dict_tree(moon_longitude, birthdt, levels):
+    def expand(item, seq_idx, depth):
+        if depth <= 0:
+            return
+        item["children"] = bw.vimshottari_subperiods(seq_idx, item["start"], item["years"])
+        for child in item["children"]:
+            expand(child, seq_idx, depth - 1)
+    out = bw.vimshottari_mahadashas(moon_longitude, birthdt)
+    for item in out:
+        expand(item, bw.VIM_SEQ.index(item["lord"]), levels - 1)
+    return out
+
+BUILDERS = [
+    ("dict tree", dict_tree),
+    ("arrays", bw.VimshottariArrays),
+    ("adapter", bw.vimshottari_tree),
+]
+
+def measure(build, args, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        build(*args)
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    result = build(*args)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return min(timings), retained, peak
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    birthdt = pytz.timezone("Asia/Kolkata").localize(datetime(1990, 5, 17, 10, 30))
+    moon_longitude = 295.036
+    print(f"{'levels':>6} {'builder':<10} {'build ms':>10} {'retained KiB':>13} {'peak KiB':>10}")
+    for levels in range(1, bw.VIM_LEVELS + 1):
+        for name, build in BUILDERS:
+            best, retained, peak = measure(build, (moon_longitude, birthdt, levels), args.repeat)
+            print(f"{levels:>6} {name:<10} {best*1000:>10.2f} {retained/1024:>13.1f} {peak/1024:>10.1f}")
+
+if __name__ == "__main__":
+    main()
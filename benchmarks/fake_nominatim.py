@@ -0,0 +1,117 @@
+"""
+Local stand-in for the Nominatim search API.
+
+    python -m benchmarks.fake_nominatim [--port 8089] [--latency 0.5] [--jitter 0.2] [--failure-rate 0.1]
+
+Point the app at it with NOMINATIM_DOMAIN=localhost:8089 NOMINATIM_SCHEME=http.
+GET /search answers after the configured latency: a --failure-rate share of
+requests get HTTP 503, queries starting with "nowhere" find nothing, and any
+other query resolves to coordinates derived from its text (a few real cities
+resolve to their real coordinates).
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+KNOWN_PLACES = {
+    "chennai": ("Chennai, Tamil Nadu, India", 13.0836939, 80.270186),
+    "mumbai": ("Mumbai, Maharashtra, India", 19.0759899, 72.8773928),
+    "london": ("London, Greater London, England, United Kingdom", 51.5074456, -0.1277653),
+    "new york": ("New York, United States", 40.7127281, -74.0060152),
+}
+
+def fake_place(query):
+    key = query.strip().lower()
+    if key in KNOWN_PLACES:
+        return KNOWN_PLACES[key]
+    digest = hashlib.sha1(key.encode()).digest()
+    lat = int.from_bytes(digest[:4], "big") / 2**32 * 120 - 55
+    lon = int.from_bytes(digest[4:8], "big") / 2**32 * 360 - 180
+    return query.title(), lat, lon
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        query = parse_qs(url.query).get("q", [""])[0]
+        server.record(query)
+        time.sleep(server.latency + server.rng_uniform(0, server.jitter))
+        if url.path != "/search":
+            self.send_error(404)
+            return
+        if server.rng_uniform(0, 1) < server.failure_rate:
+            self.send_error(503, "Service Unavailable")
+            return
+        if query.strip().lower().startswith("nowhere"):
+            results = []
+        else:
+            name, lat, lon = fake_place(query)
+            results = [{"display_name": name, "lat": f"{lat:.7f}", "lon": f"{lon:.7f}",
+                        "place_id": 1, "osm_type": "node", "osm_id": 1, "importance": 0.5}]
+        body = json.dumps(results).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, fmt, *args):
+        pass
+
+class FakeNominatim(ThreadingHTTPServer):
+    """
+    Threaded fake server; `requests` counts the queries it has received.
+    """
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0.0, jitter=0.0, failure_rate=0.0, seed=0):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.requests = Counter()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @property
+    def domain(self):
+        return f"127.0.0.1:{self.server_address[1]}"
+
+    def record(self, query):
+        with self._lock:
+            self.requests[query] += 1
+
+    def rng_uniform(self, low, high):
+        with self._lock:
+            return self._rng.uniform(low, high)
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    server = FakeNominatim(args.port, args.latency, args.jitter, args.failure_rate)
+    print(f"fake Nominatim on http://{server.domain}/search")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
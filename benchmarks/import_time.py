@@ -0,0 +1,77 @@
+"""
+Import-time budget for the web module.
+
+    python -m benchmarks.import_time [--runs N] [--top N] [--budget FILE] [--update]
+
+Imports birthchart_web in fresh interpreters under `python -X importtime`
+(warm-up off, bytecode cache primed by a first discarded run), prints the
+median cumulative import time and the heaviest modules, and exits non-zero
+when the median is over budget or a module the budget lists as deferred was
+imported. --update rewrites the budget as the median plus 25% headroom.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+MODULE = "birthchart_web"
+DEFAULT_BUDGET = os.path.join(os.path.dirname(__file__), "import_budget.json")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def import_times():
+    """
+    {module: (self_us, cumulative_us)} for one fresh import of MODULE.
+    """
+    env = {k: v for k, v in os.environ.items() if k != "PYTHONDONTWRITEBYTECODE"}
+    env["BIRTHCHART_WARM_UP"] = "0"
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {MODULE}"],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    )
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--budget", default=DEFAULT_BUDGET)
+    parser.add_argument("--update", action="store_true")
+    args = parser.parse_args()
+
+    with open(args.budget) as fh:
+        budget = json.load(fh)
+    import_times()
+    runs = [import_times() for _ in range(args.runs)]
+    median_ms = statistics.median(r[MODULE][1] for r in runs) / 1000
+
+    last = runs[-1]
+    print(f"{'cumulative ms':>13} {'self ms':>8}  module")
+    for name, (self_us, cumulative_us) in sorted(last.items(), key=lambda kv: -kv[1][1])[:args.top]:
+        print(f"{cumulative_us / 1000:13.1f} {self_us / 1000:8.1f}  {name}")
+    deferred = sorted(
+        name for name in last
+        if any(name == d or name.startswith(d + ".") for d in budget["deferred"])
+    )
+    print(f"\n{MODULE}: median {median_ms:.1f} ms over {args.runs} runs, budget {budget['import_ms']} ms")
+    if deferred:
+        print(f"deferred modules imported at startup: {', '.join(deferred)}")
+
+    if args.update:
+        budget["import_ms"] = round(median_ms * 1.25)
+        with open(args.budget, "w") as fh:
+            json.dump(budget, fh, indent=2)
+            fh.write("\n")
+        print(f"budget updated to {budget['import_ms']} ms")
+        return
+    sys.exit(1 if deferred or median_ms > budget["import_ms"] else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Checks the geocoder's deadline, request coalescing and failure handling.
+
+    python -m benchmarks.stress_geocode [--callers N] [--latency S] [--deadline S]
+
+Runs against benchmarks.fake_nominatim on a local port and exits non-zero if
+any scenario misbehaves:
+
+    burst       N concurrent lookups of one uncached place -> one upstream request
+    deadline    upstream slower than the deadline -> GeocodeUnavailable in time,
+                and the late answer is served from memory afterwards
+    failure     upstream 503s -> GeocodeUnavailable, nothing cached
+    coordinates "lat, lon" input -> no upstream request at all
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("BIRTHCHART_WARM_UP", "0")
+
+import birthchart_web as bw
+from benchmarks.fake_nominatim import FakeNominatim
+
+def make_geocoder(server, deadline):
+    return bw.Geocoder(deadline=deadline, upstream_timeout=10.0, domain=server.domain, scheme="http", workers=8)
+
+def burst(args):
+    server = FakeNominatim(latency=args.latency / 2).start()
+    geocoder = make_geocoder(server, args.deadline)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(args.callers) as pool:
+        results = list(pool.map(lambda _: geocoder.geocode("Chennai"), range(args.callers)))
+    elapsed = time.perf_counter() - started
+    server.stop()
+    upstream = server.requests["Chennai"]
+    ok = upstream == 1 and all(r is not None and round(r.latitude, 2) == 13.08 for r in results)
+    return ok, f"{args.callers} callers, {upstream} upstream request(s), {elapsed:.2f}s, stats {geocoder.stats()}"
+
+def deadline(args):
+    server = FakeNominatim(latency=args.deadline * 2).start()
+    geocoder = make_geocoder(server, args.deadline)
+
+    def call(_):
+        started = time.perf_counter()
+        try:
+            geocoder.geocode("Mumbai")
+            timed_out = False
+        except bw.GeocodeUnavailable:
+            timed_out = True
+        return timed_out, time.perf_counter() - started
+
+    with ThreadPoolExecutor(args.callers) as pool:
+        results = list(pool.map(call, range(args.callers)))
+    errors = sum(timed_out for timed_out, _ in results)
+    longest = max(wait for _, wait in results)
+    time.sleep(args.deadline * 1.5)
+    late = geocoder.geocode("Mumbai")
+    server.stop()
+    ok = errors == args.callers and longest < args.deadline + 0.25 and late is not None and server.requests["Mumbai"] == 1
+    return ok, (f"{errors}/{args.callers} timed out, longest wait {longest:.2f}s, late answer cached: "
+                f"{late is not None}, {server.requests['Mumbai']} upstream request(s)")
+
+def failure(args):
+    server = FakeNominatim(failure_rate=1.0).start()
+    geocoder = make_geocoder(server, args.deadline)
+    try:
+        geocoder.geocode("London")
+        raised = False
+    except bw.GeocodeUnavailable:
+        raised = True
+    server.stop()
+    return raised and len(geocoder.memory) == 0, f"unavailable raised: {raised}, cached entries: {len(geocoder.memory)}"
+
+def coordinates(args):
+    server = FakeNominatim().start()
+    bw.geocoder = make_geocoder(server, args.deadline)
+    loc = bw.resolve_location("13.08, 80.27")
+    server.stop()
+    ok = loc is not None and sum(server.requests.values()) == 0
+    return ok, f"resolved to {loc}, {sum(server.requests.values())} upstream request(s)"
+
+SCENARIOS = [burst, deadline, failure, coordinates]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--callers", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--deadline", type=float, default=1.0)
+    args = parser.parse_args()
+    failed = 0
+    for scenario in SCENARIOS:
+        ok, detail = scenario(args)
+        failed += not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {scenario.__name__:<12} {detail}")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Checks that chart calculations stay correct under threads.
+
+    python -m benchmarks.stress_threads [--charts N] [--threads N] [--batch-timeout S]
+
+Computes a corpus of charts with mixed ayanamsas single-threaded, then again
+from a thread pool in shuffled order, and exits non-zero if any result differs.
+Then runs a process-pool batch while a thread keeps calling the ephemeris
+(forked workers must not inherit its lock as held) and exits non-zero if the
+batch does not finish within --batch-timeout seconds.
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("BIRTHCHART_WARM_UP", "0")
+
+import birthchart_web as bw
+
+def corpus(n, seed=0):
+    rng = random.Random(seed)
+    ayanamsas = sorted(bw.AYANAMSAS)
+    return [
+        (
+            2415020.5 + rng.uniform(0, 73000),
+            rng.uniform(-60, 60),
+            rng.uniform(-180, 180),
+            ayanamsas[i % len(ayanamsas)],
+        )
+        for i in range(n)
+    ]
+
+def compute(case):
+    jd, lat, lon, ayanamsa = case
+    ascendant, cusps = bw.get_ascendant_and_houses(jd, lat, lon, ayanamsa)
+    positions = bw.get_planet_positions(jd, ayanamsa)
+    return (ascendant, tuple(cusps), tuple(positions.values()))
+
+def batch_under_load(rows, timeout):
+    # count of records from iter_batch_charts, or None if it did not finish in time
+    stop = threading.Event()
+
+    def spin():
+        while not stop.is_set():
+            bw.get_planet_positions(2451545.0)
+
+    done = []
+    threading.Thread(target=spin, daemon=True).start()
+    runner = threading.Thread(target=lambda: done.append(sum(1 for _ in bw.iter_batch_charts(rows, workers=2, chunk_size=8))),
+                              daemon=True)
+    runner.start()
+    runner.join(timeout)
+    stop.set()
+    return done[0] if done else None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--charts", type=int, default=5000)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-timeout", type=float, default=30.0)
+    args = parser.parse_args()
+
+    cases = corpus(args.charts, args.seed)
+    started = time.perf_counter()
+    expected = [compute(case) for case in cases]
+    serial = time.perf_counter() - started
+
+    order = list(range(len(cases)))
+    random.Random(args.seed + 1).shuffle(order)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(args.threads) as pool:
+        results = dict(zip(order, pool.map(lambda i: compute(cases[i]), order)))
+    threaded = time.perf_counter() - started
+
+    mismatches = [i for i in order if results[i] != expected[i]]
+    print(f"{len(cases)} charts: serial {serial:.2f}s, {args.threads} threads {threaded:.2f}s, "
+          f"{len(mismatches)} mismatches")
+    for i in mismatches[:10]:
+        print(f"  case {cases[i]}: expected {expected[i][0]:.6f}, got {results[i][0]:.6f}")
+
+    rows = [{"id": i, "dob": "1990-05-15", "tob": "10:30", "lat": lat, "lon": lon, "tz": "UTC"}
+            for i, (_, lat, lon, _) in enumerate(cases[:64])]
+    started = time.perf_counter()
+    count = batch_under_load(rows, args.batch_timeout)
+    if count is None:
+        print(f"batch under ephemeris load: no result after {args.batch_timeout:g}s (deadlocked workers?)")
+        sys.stdout.flush()
+        for child in multiprocessing.active_children():
+            child.kill()
+        os._exit(1)  # the stuck pool would block interpreter shutdown
+    print(f"batch under ephemeris load: {count} records in {time.perf_counter() - started:.2f}s")
+    sys.exit(1 if mismatches or count != len(rows) else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Command line tools for the birth chart app.
+
+    python birthchart_cli.py batch births.csv -o charts.jsonl
+    python birthchart_cli.py batch births.csv -o /dev/null --store charts.db
+    python birthchart_cli.py build-ephemeris -o ephemeris_kp.npy
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import birthchart_web as bw
+
+def _open_input(path):
+    return sys.stdin if path == "-" else open(path, encoding="utf-8", newline="")
+
+def _open_output(path):
+    return sys.stdout if path == "-" else open(path, "w", encoding="utf-8")
+
+def cmd_batch(args):
+    fmt = args.format or ("jsonl" if args.input.endswith((".jsonl", ".ndjson")) else "csv")
+    progress = bw.BatchProgress()
+    last_report = time.monotonic()
+    with _open_input(args.input) as src, _open_output(args.output) as out:
+        rows = bw.read_batch_rows(src, fmt)
+        records = bw.iter_batch_charts(rows, workers=args.workers, chunk_size=args.chunk_size,
+                                       progress=progress, ayanamsa=args.ayanamsa)
+        store = bw.ChartStore(args.store) if args.store else None
+        if store is not None:
+            records = store.ingesting(records)
+        for record in records:
+            out.write(json.dumps(record, separators=(",", ":")) + "\n")
+            if time.monotonic() - last_report >= args.progress_every:
+                print(progress, file=sys.stderr)
+                last_report = time.monotonic()
+    print(f"done: {progress}", file=sys.stderr)
+    if store is not None:
+        store.optimize()
+        print(f"{args.store}: {len(store)} charts stored", file=sys.stderr)
+
+def cmd_build_ephemeris(args):
+    started = time.monotonic()
+    table = bw.EphemerisTable.build_years(args.start_year, args.end_year, args.step, args.ayanamsa)
+    table.save(args.output)
+    print(f"wrote {args.output}: {table.data.shape[0]} samples in {time.monotonic() - started:.1f}s", file=sys.stderr)
+    for name, arcsec in table.max_error(args.check_samples).items():
+        print(f"{name:>8}: max error {arcsec:.3f}\"", file=sys.stderr)
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Birth chart command line tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    batch = commands.add_parser("batch", help="compute charts for a CSV/JSONL file of births, writing JSONL")
+    batch.add_argument("input", help="CSV or JSONL file with dob, tob and place or lat/lon[/tz] ('-' for stdin)")
+    batch.add_argument("-o", "--output", default="-", help="JSONL output file (default stdout)")
+    batch.add_argument("--format", choices=["csv", "jsonl"], help="input format (default from file extension)")
+    batch.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    batch.add_argument("--chunk-size", type=int, default=256, help="rows per task sent to a worker")
+    batch.add_argument("--ayanamsa", choices=sorted(bw.AYANAMSAS), default=bw.DEFAULT_AYANAMSA)
+    batch.add_argument("--store", metavar="PATH", help="also save the charts to this SQLite chart store")
+    batch.add_argument("--progress-every", type=float, default=5.0, help="seconds between progress lines on stderr")
+    batch.set_defaults(func=cmd_batch)
+
+    ephemeris = commands.add_parser("build-ephemeris", help="precompute the sidereal ephemeris table")
+    ephemeris.add_argument("-o", "--output", required=True, help=".npy path (metadata goes to <path>.json)")
+    ephemeris.add_argument("--start-year", type=int, default=1900)
+    ephemeris.add_argument("--end-year", type=int, default=2100)
+    ephemeris.add_argument("--ayanamsa", choices=sorted(bw.AYANAMSAS), default=bw.DEFAULT_AYANAMSA)
+    ephemeris.add_argument("--step", type=float, default=1.0, help="sample spacing in days")
+    ephemeris.add_argument("--check-samples", type=int, default=2000, help="random instants checked against swe.calc_ut")
+    ephemeris.set_defaults(func=cmd_build_ephemeris)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,28 @@
+import csv
+import hashlib
+import io
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, bisect_right
+from collections import Counter, OrderedDict, namedtuple
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from concurrent.futures import TimeoutError as FutureTimeout
+from functools import lru_cache
+from itertools import islice
+import numpy as np
 import swisseph as swe
 from datetime import datetime, timedelta
 import pytz
-from flask import Flask, request, render_template_string
-from geopy.geocoders import Nominatim
-from timezonefinder import TimezoneFinder
+from flask import (Blueprint, Flask, Response, current_app, g, has_request_context, request, jsonify, redirect,
+                   stream_with_context, url_for)
 
-app = Flask(__name__)
+bp = Blueprint("birthchart", __name__)
 
 PLANET_ABBR = {
     "Sun": "Su", "Moon": "Mo", "Mars": "Ma", "Mercury": "Me", "Jupiter": "Ju", "Venus": "Ve",
@@ -37,19 +54,414 @@ VIM_YEARS = {
     "Ketu": 7, "Venus": 20, "Sun": 6, "Moon": 10, "Mars": 7, "Rahu": 18, "Jupiter": 16, "Saturn": 19, "Mercury": 17
 }
 NAKSHATRA_LORDS = VIM_SEQ * 3  # 27
+VIM_LEVELS = 5  # dasha, bhukti, antara, sukshma, prana
 
-MAANDI_DEGREES = {
-    "Sunday":   (156, 240),
-    "Monday":   (132, 216),
-    "Tuesday":  (108, 192),
-    "Wednesday":(84, 336),
-    "Thursday": (60, 312),
-    "Friday":   (36, 288),
-    "Saturday": (12, 264),
-}
+# --- geocoding ---
+GeoLocation = namedtuple("GeoLocation", ["address", "latitude", "longitude"])
+
+def normalize_place(place):
+    text = unicodedata.normalize("NFKC", place or "").casefold()
+    parts = (" ".join(p.split()) for p in text.split(","))
+    return ", ".join(p for p in parts if p)
+
+class LRUCache:
+    """
+    Bounded, thread-safe least-recently-used mapping.
+    """
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return default
+            return self._data[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+class GeocodeDiskCache:
+    """
+    Persistent geocode results in SQLite, keyed by normalized place string.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS geocode ("
+                "place TEXT PRIMARY KEY, address TEXT, latitude REAL, longitude REAL)"
+            )
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT address, latitude, longitude FROM geocode WHERE place = ?", (key,)
+            ).fetchone()
+        return GeoLocation(*row) if row else None
+
+    def put(self, key, loc):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO geocode VALUES (?, ?, ?, ?)",
+                (key, loc.address, loc.latitude, loc.longitude)
+            )
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM geocode").fetchone()[0]
+
+def _trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i+3] for i in range(len(padded) - 2)}
+
+class Gazetteer:
+    """
+    Offline place lookup over a GeoNames-style dump (cities15000.txt, allCountries.txt, ...).
+    Exact names are tried first, then name prefixes, then trigram similarity. Prefix and
+    fuzzy hits must be at least min_similarity alike to the query ("Chen" is not Chennai).
+    Qualifiers after the name ("Paris, Texas" / "Chennai, TN, India") must each name the
+    place's country or first-level division (code or name); remaining ties go to the
+    largest population. Anything less certain returns None, leaving it to the remote geocoder;
+    such misses are remembered (up to miss_cache_size) so they are not rescanned.
+    """
+    def __init__(self, entries, country_names=None, min_similarity=0.6, admin1_names=None, miss_cache_size=4096):
+        # entries: (name, latitude, longitude, country_code, population[, admin1_code])
+        self.entries = entries
+        self.country_names = country_names or {}
+        self.admin1_names = admin1_names or {}  # "US.TX" -> "Texas"
+        self.min_similarity = min_similarity
+        keyed = sorted((normalize_place(e[0]), i) for i, e in enumerate(entries))
+        self._keys = [k for k, _ in keyed]
+        self._ids = [i for _, i in keyed]
+        self._gram_counts = np.zeros(len(entries), dtype=np.int32)
+        index = {}
+        for key, i in keyed:
+            grams = _trigrams(key)
+            self._gram_counts[i] = len(grams)
+            for tg in grams:
+                index.setdefault(tg, []).append(i)
+        self._trigram_index = {tg: np.array(ids, dtype=np.int32) for tg, ids in index.items()}
+        self._misses = LRUCache(miss_cache_size)
+
+    @classmethod
+    def from_geonames(cls, path, country_info_path=None, min_population=0, alternate_names=False,
+                      admin1_path=None):
+        entries = []
+        with open(path, encoding="utf-8") as fh:
+            for line in fh:
+                cols = line.rstrip("\n").split("\t")
+                if len(cols) < 15 or cols[6] != "P":
+                    continue
+                population = int(cols[14] or 0)
+                if population < min_population:
+                    continue
+                lat, lon, cc, admin1 = float(cols[4]), float(cols[5]), cols[8], cols[10]
+                names = {cols[1], cols[2]}
+                if alternate_names and cols[3]:
+                    names.update(cols[3].split(","))
+                for name in names:
+                    if name:
+                        entries.append((name, lat, lon, cc, population, admin1))
+
+        def sibling(given, filename):
+            if given is not None:
+                return given
+            candidate = os.path.join(os.path.dirname(path), filename)
+            return candidate if os.path.exists(candidate) else None
+
+        country_names = {}
+        country_info_path = sibling(country_info_path, "countryInfo.txt")
+        if country_info_path:
+            with open(country_info_path, encoding="utf-8") as fh:
+                for line in fh:
+                    if line.startswith("#"):
+                        continue
+                    cols = line.rstrip("\n").split("\t")
+                    if len(cols) > 4:
+                        country_names[cols[0]] = cols[4]
+        admin1_names = {}
+        admin1_path = sibling(admin1_path, "admin1CodesASCII.txt")
+        if admin1_path:
+            with open(admin1_path, encoding="utf-8") as fh:
+                for line in fh:
+                    cols = line.rstrip("\n").split("\t")
+                    if len(cols) > 1:
+                        admin1_names[cols[0]] = cols[1]
+        return cls(entries, country_names, admin1_names=admin1_names)
+
+    def _prefix_range(self, prefix):
+        lo = bisect_left(self._keys, prefix)
+        hi = bisect_left(self._keys, prefix + "\uffff")
+        return zip(self._keys[lo:hi], self._ids[lo:hi])
+
+    def _admin1(self, entry):
+        code = entry[5] if len(entry) > 5 else ""
+        return code, self.admin1_names.get(f"{entry[3]}.{code}", "")
+
+    def _qualifies(self, i, qualifiers):
+        entry = self.entries[i]
+        admin1_code, admin1_name = self._admin1(entry)
+        names = {entry[3], self.country_names.get(entry[3], ""), admin1_code, admin1_name}
+        names = {n.casefold() for n in names if n}
+        return qualifiers <= names
+
+    def _similar(self, name, keys=None):
+        # ids whose name shares at least min_similarity of trigrams (Jaccard) with `name`,
+        # among `keys` ((key, id) pairs) or, by default, the whole trigram index
+        grams = _trigrams(name)
+        if keys is not None:
+            ids = np.array([i for _, i in keys], dtype=np.int64)
+            shared = np.array([len(grams & _trigrams(key)) for key, _ in keys], dtype=np.int64)
+        else:
+            postings = [self._trigram_index[tg] for tg in grams if tg in self._trigram_index]
+            if not postings:
+                return []
+            ids, shared = np.unique(np.concatenate(postings), return_counts=True)
+            # Jaccard >= t needs at least t * len(grams) trigrams in common
+            keep = shared >= np.ceil(self.min_similarity * len(grams))
+            ids, shared = ids[keep], shared[keep]
+        union = len(grams) + self._gram_counts[ids] - shared
+        return ids[shared >= self.min_similarity * union].tolist()
+
+    def lookup(self, place):
+        parts = normalize_place(place).split(", ")
+        name, qualifiers = parts[0], set(parts[1:])
+        if not name or self._misses.get(", ".join(parts)):
+            return None
+        prefixed = list(self._prefix_range(name))
+        candidates = ([i for key, i in prefixed if key == name]
+                      or self._similar(name, prefixed) or self._similar(name))
+        candidates = [i for i in candidates if self._qualifies(i, qualifiers)]
+        if not candidates:
+            self._misses.put(", ".join(parts), True)
+            return None
+        best = self.entries[max(candidates, key=lambda i: self.entries[i][4])]
+        parts = [best[0], self._admin1(best)[1], self.country_names.get(best[3], best[3])]
+        return GeoLocation(", ".join(p for p in parts if p), best[1], best[2])
+
+    def __len__(self):
+        return len(self.entries)
+
+class GeocodeUnavailable(RuntimeError):
+    """
+    The remote geocoder failed or missed the deadline; the place may still
+    resolve on a later attempt.
+    """
+
+def parse_coordinates(text):
+    # "13.08, 80.27" or "13.08 80.27" -> (lat, lon); None for anything else
+    parts = (text or "").replace(",", " ").split()
+    if len(parts) != 2:
+        return None
+    try:
+        lat, lon = float(parts[0]), float(parts[1])
+    except ValueError:
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return lat, lon
+
+class Geocoder:
+    """
+    Place lookup through an in-process LRU, an optional SQLite cache and an optional
+    offline gazetteer; Nominatim is only queried when all of them miss. Remote
+    lookups run on a small thread pool: callers wait at most `deadline` seconds,
+    concurrent lookups of the same place share one upstream request, and a
+    lookup that finishes after its callers gave up still fills the caches.
+    """
+    def __init__(self, user_agent="astro_kp_app", cache_size=2048, cache_path=None, gazetteer=None,
+                 deadline=2.0, upstream_timeout=10.0, domain=None, scheme=None, workers=4):
+        self.user_agent = user_agent
+        self.memory = LRUCache(cache_size)
+        self.disk = GeocodeDiskCache(cache_path) if cache_path else None
+        self.gazetteer = gazetteer
+        self.deadline = deadline
+        self.upstream_timeout = upstream_timeout
+        self.domain = domain
+        self.scheme = scheme
+        self.workers = workers
+        self._nominatim = None
+        self._executor = None
+        self._inflight = {}
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def _count(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    def _remote_geocode(self, place):
+        if self._nominatim is None:
+            from geopy.geocoders import Nominatim
+            options = {"domain": self.domain, "scheme": self.scheme}
+            self._nominatim = Nominatim(user_agent=self.user_agent, timeout=self.upstream_timeout,
+                                        **{k: v for k, v in options.items() if v})
+        loc = self._nominatim.geocode(place)
+        if not loc:
+            return None
+        return GeoLocation(loc.address, loc.latitude, loc.longitude)
+
+    def _fetch(self, place, key):
+        self._count("upstream_requests")
+        loc = self._remote_geocode(place)
+        if loc is not None:
+            self.memory.put(key, loc)
+            if self.disk is not None:
+                self.disk.put(key, loc)
+        return loc
+
+    def _forget(self, key, future):
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def _remote_lookup(self, place, key):
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is None:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="geocode")
+                future = self._inflight[key] = self._executor.submit(self._fetch, place, key)
+                future.add_done_callback(lambda f: self._forget(key, f))
+            else:
+                self._counts["coalesced"] += 1
+        try:
+            return future.result(timeout=self.deadline)
+        except FutureTimeout:
+            self._count("timeouts")
+            raise GeocodeUnavailable(f"Geocoding {place!r} took longer than {self.deadline:g}s") from None
+        except Exception as e:
+            self._count("errors")
+            raise GeocodeUnavailable(f"Geocoding {place!r} failed: {e}") from e
+
+    def geocode(self, place):
+        key = normalize_place(place)
+        if not key:
+            return None
+        loc = self.memory.get(key)
+        if loc is not None:
+            self._count("memory_hits")
+            return loc
+        if self.disk is not None:
+            loc = self.disk.get(key)
+            if loc is not None:
+                self._count("disk_hits")
+                self.memory.put(key, loc)
+                return loc
+        if self.gazetteer is not None:
+            loc = self.gazetteer.lookup(key)
+            if loc is not None:
+                self._count("gazetteer_hits")
+                self.memory.put(key, loc)
+                return loc
+        self._count("misses")
+        loc = self._remote_lookup(place, key)
+        if loc is None:
+            self._count("not_found")
+        return loc
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._counts)
+        hits = sum(v for k, v in counts.items() if k.endswith("_hits"))
+        lookups = hits + counts.get("misses", 0)
+        counts.update({
+            "hits": hits,
+            "lookups": lookups,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "memory_size": len(self.memory),
+        })
+        return counts
+
+def _load_gazetteer():
+    path = os.environ.get("GEONAMES_PATH")
+    if not path:
+        return None
+    return Gazetteer.from_geonames(
+        path,
+        min_population=int(os.environ.get("GEONAMES_MIN_POPULATION", 0)),
+        alternate_names=os.environ.get("GEONAMES_ALTERNATE_NAMES") == "1"
+    )
+
+geocoder = Geocoder(
+    cache_size=int(os.environ.get("GEOCODE_CACHE_SIZE", 2048)),
+    cache_path=os.environ.get("GEOCODE_CACHE_PATH"),
+    gazetteer=_load_gazetteer(),
+    deadline=float(os.environ.get("GEOCODE_DEADLINE", 2.0)),
+    upstream_timeout=float(os.environ.get("GEOCODE_UPSTREAM_TIMEOUT", 10.0)),
+    domain=os.environ.get("NOMINATIM_DOMAIN"),
+    scheme=os.environ.get("NOMINATIM_SCHEME"),
+    workers=int(os.environ.get("GEOCODE_WORKERS", 4))
+)
+
+def resolve_location(place, lat=None, lon=None):
+    """
+    GeoLocation for explicit lat/lon, a "lat, lon" string or a place name, in
+    that order; only place names are geocoded. None if the place is unknown,
+    GeocodeUnavailable if the geocoder could not answer in time.
+    """
+    if lat not in (None, "") and lon not in (None, ""):
+        coords = parse_coordinates(f"{lat} {lon}")
+        if coords is None:
+            raise ValueError(f"Invalid coordinates {lat!r}, {lon!r}")
+    else:
+        coords = parse_coordinates(place)
+    if coords is not None:
+        return GeoLocation(f"{coords[0]:.4f}, {coords[1]:.4f}", *coords)
+    return geocoder.geocode(place)
+
+# --- timezones ---
+TZ_GRID_DEGREES = float(os.environ.get("TZ_GRID_DEGREES", 0.01))
+_timezone_finder = None
+_timezone_finder_lock = threading.Lock()
+
+def get_timezone_finder():
+    """
+    Process-wide TimezoneFinder. TZ_IN_MEMORY=1 reads the polygon data into RAM,
+    otherwise it is memory-mapped and shared between worker processes by the OS.
+    """
+    global _timezone_finder
+    if _timezone_finder is None:
+        with _timezone_finder_lock:
+            if _timezone_finder is None:
+                from timezonefinder import TimezoneFinder
+                _timezone_finder = TimezoneFinder(in_memory=os.environ.get("TZ_IN_MEMORY") == "1")
+    return _timezone_finder
+
+@lru_cache(maxsize=65536)
+def _timezone_at_cell(lat_cell, lon_cell):
+    return get_timezone_finder().timezone_at(lat=lat_cell * TZ_GRID_DEGREES, lng=lon_cell * TZ_GRID_DEGREES)
+
+def timezone_at(lat, lon):
+    """
+    Memoized timezone_at on a TZ_GRID_DEGREES grid (0.01 deg ~ 1 km), so repeat
+    cities skip the polygon search. Returns None over oceans, like TimezoneFinder.
+    """
+    return _timezone_at_cell(round(lat / TZ_GRID_DEGREES), round(lon / TZ_GRID_DEGREES))
+
+@lru_cache(maxsize=None)
+def get_tz(tz_str):
+    return pytz.timezone(tz_str)
 
 def get_julian_day(year, month, day, hour, minute, second, tz_str):
-    tz = pytz.timezone(tz_str)
+    tz = get_tz(tz_str)
     dt = tz.localize(datetime(year, month, day, hour, minute, second))
     ut_dt = dt.astimezone(pytz.utc)
     jd = swe.julday(ut_dt.year, ut_dt.month, ut_dt.day,
@@ -71,25 +483,188 @@ def format_rasi_dms(longitude):
     d, m, s = dms(deg_in_rasi)
     return f"{d}° {abs(m):02d}' {abs(s):05.2f}\""
 
-def get_ascendant_and_houses(jd, lat, lon):
-    swe.set_sid_mode(swe.SIDM_KRISHNAMURTI)
-    house_cusps, ascmc = swe.houses_ex(jd, lat, lon, b'A', flags=swe.FLG_SIDEREAL)
-    ascendant = ascmc[0]
+# --- swiss ephemeris access ---
+AYANAMSAS = {
+    "kp": swe.SIDM_KRISHNAMURTI,
+    "lahiri": swe.SIDM_LAHIRI,
+    "raman": swe.SIDM_RAMAN,
+}
+DEFAULT_AYANAMSA = "kp"
+HOUSE_SYSTEM = os.environ.get("HOUSE_SYSTEM", "P").encode()  # Placidus cusps, as KP uses
+_swe_lock = threading.RLock()
+
+def _reset_swe_lock():
+    # a forked child (the batch and panchanga pool workers) inherits the lock as it was at
+    # fork time; if another thread held it, nothing in the child would ever release it
+    global _swe_lock
+    _swe_lock = threading.RLock()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_swe_lock)
+
+@contextmanager
+def sidereal(ayanamsa=DEFAULT_AYANAMSA):
+    """
+    Runs the enclosed Swiss Ephemeris calls under a lock with the sidereal
+    mode set for `ayanamsa`. pyswisseph keeps the mode in thread-local state
+    (a new thread starts on the library default), so it is reapplied on
+    every entry; that costs well under a microsecond and stays correct with
+    any mix of ayanamsas and threads.
+    """
+    if ayanamsa not in AYANAMSAS:
+        raise ValueError(f"Unknown ayanamsa {ayanamsa!r}; expected one of {', '.join(AYANAMSAS)}")
+    with _swe_lock:
+        swe.set_sid_mode(AYANAMSAS[ayanamsa])
+        yield
+
+def get_houses(jd, lat, lon, ayanamsa=DEFAULT_AYANAMSA):
+    """
+    Ascendant, house cusps and the house system that produced them (the
+    HOUSE_SYSTEM code, or b'O' for Porphyry where it has no cusps).
+    """
+    with sidereal(ayanamsa):
+        try:
+            house_cusps, ascmc = swe.houses_ex(jd, lat, lon, HOUSE_SYSTEM, flags=swe.FLG_SIDEREAL)
+            system = HOUSE_SYSTEM
+        except swe.Error:
+            # Placidus and Koch have no cusps inside the polar circles
+            house_cusps, ascmc = swe.houses_ex(jd, lat, lon, b'O', flags=swe.FLG_SIDEREAL)
+            system = b'O'
+    return ascmc[0], house_cusps, system
+
+def get_ascendant_and_houses(jd, lat, lon, ayanamsa=DEFAULT_AYANAMSA):
+    ascendant, house_cusps, system = get_houses(jd, lat, lon, ayanamsa)
     return ascendant, house_cusps
 
-def get_planet_positions(jd):
-    swe.set_sid_mode(swe.SIDM_KRISHNAMURTI)
+def get_planet_positions(jd, ayanamsa=DEFAULT_AYANAMSA):
+    if np.ndim(jd):
+        return get_planet_positions_array(jd, ayanamsa)
     positions = {}
-    for name, code in PLANETS:
-        if name == "Ketu":
-            rahu_lon = positions["Rahu"]
-            ketu_lon = (rahu_lon + 180) % 360
-            positions["Ketu"] = ketu_lon
-        else:
-            ret, flag = swe.calc_ut(jd, code, swe.FLG_SIDEREAL)
-            positions[name] = ret[0]
+    with sidereal(ayanamsa):
+        for name, code in PLANETS:
+            if name == "Ketu":
+                rahu_lon = positions["Rahu"]
+                ketu_lon = (rahu_lon + 180) % 360
+                positions["Ketu"] = ketu_lon
+            else:
+                ret, flag = swe.calc_ut(jd, code, swe.FLG_SIDEREAL)
+                positions[name] = ret[0]
     return positions
 
+# --- ephemeris table ---
+PLANET_NAMES = [name for name, _ in PLANETS]
+RAHU_COL, KETU_COL = PLANET_NAMES.index("Rahu"), PLANET_NAMES.index("Ketu")
+
+def _swe_longitudes_and_speeds(jd, ayanamsa=DEFAULT_AYANAMSA):
+    row = np.empty((len(PLANETS), 2))
+    with sidereal(ayanamsa):
+        for col, (name, code) in enumerate(PLANETS):
+            if col != KETU_COL:
+                ret, flag = swe.calc_ut(jd, code, swe.FLG_SIDEREAL | swe.FLG_SPEED)
+                row[col] = ret[0], ret[3]
+    row[KETU_COL] = (row[RAHU_COL, 0] + 180) % 360, row[RAHU_COL, 1]
+    return row
+
+class EphemerisTable:
+    """
+    Sidereal longitudes and speeds of PLANETS sampled every `step` days
+    from `start_jd`, as an (n, 9, 2) float64 array, evaluated between samples
+    with cubic Hermite interpolation. With the default 1-day step over
+    1900-2100 the error against swe.calc_ut is under 1 arcsecond for every
+    body, apart from isolated samples where Swiss Ephemeris' own speeds jump
+    (up to ~3 arcseconds for Saturn); max_error() re-checks a table.
+    Saved as <path> (np.save, memory-mapped on load) plus <path>.json metadata.
+    """
+    def __init__(self, data, start_jd, step=1.0, ayanamsa=DEFAULT_AYANAMSA):
+        self.data = data
+        self.start_jd = start_jd
+        self.step = step
+        self.ayanamsa = ayanamsa
+        self.end_jd = start_jd + (len(data) - 1) * step
+
+    @classmethod
+    def build(cls, start_jd, end_jd, step=1.0, ayanamsa=DEFAULT_AYANAMSA):
+        n = int(np.ceil((end_jd - start_jd) / step)) + 1
+        data = np.empty((n, len(PLANETS), 2))
+        for i in range(n):
+            data[i] = _swe_longitudes_and_speeds(start_jd + i*step, ayanamsa)
+        return cls(data, start_jd, step, ayanamsa)
+
+    @classmethod
+    def build_years(cls, start_year=1900, end_year=2100, step=1.0, ayanamsa=DEFAULT_AYANAMSA):
+        return cls.build(swe.julday(start_year, 1, 1, 0), swe.julday(end_year + 1, 1, 1, 0), step, ayanamsa)
+
+    def save(self, path):
+        np.save(path, self.data)
+        with open(path + ".json", "w") as fh:
+            json.dump({"start_jd": self.start_jd, "step": self.step, "ayanamsa": self.ayanamsa,
+                       "columns": PLANET_NAMES}, fh)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        with open(path + ".json") as fh:
+            meta = json.load(fh)
+        return cls(np.load(path, mmap_mode="r" if mmap else None), meta["start_jd"], meta["step"], meta["ayanamsa"])
+
+    def covers(self, jds):
+        jds = np.asarray(jds)
+        return bool(jds.size) and jds.min() >= self.start_jd and jds.max() <= self.end_jd
+
+    def interpolate(self, jds, cols=slice(None)):
+        """
+        Longitudes and speeds (deg/day) at `jds` for the bodies selected by
+        `cols`; `cols` may also be an array of column indices aligned with `jds`.
+        """
+        x = (np.asarray(jds, dtype=np.float64) - self.start_jd) / self.step
+        i = np.clip(np.floor(x).astype(np.intp), 0, len(self.data) - 2)
+        u = x - i
+        if not isinstance(cols, slice):
+            cols = np.asarray(cols)
+        else:
+            u = u[..., None]
+        p0, v0 = self.data[i, cols, 0], self.data[i, cols, 1] * self.step
+        p1, v1 = self.data[i + 1, cols, 0], self.data[i + 1, cols, 1] * self.step
+        d = (p1 - p0 + 180) % 360 - 180
+        u2 = u*u
+        u3 = u2*u
+        lon = p0 + (u3 - 2*u2 + u)*v0 + (3*u2 - 2*u3)*d + (u3 - u2)*v1
+        speed = ((3*u2 - 4*u + 1)*v0 + (6*u - 6*u2)*d + (3*u2 - 2*u)*v1) / self.step
+        return lon % 360, speed
+
+    def positions(self, jds):
+        return self.interpolate(jds)[0]
+
+    def max_error(self, samples=2000, seed=0):
+        """
+        Largest absolute difference from swe.calc_ut per body, in arcseconds,
+        over `samples` random instants inside the table.
+        """
+        rng = np.random.default_rng(seed)
+        jds = rng.uniform(self.start_jd, self.end_jd, samples)
+        exact = np.array([_swe_longitudes_and_speeds(jd, self.ayanamsa)[:, 0] for jd in jds])
+        diff = (self.positions(jds) - exact + 180) % 360 - 180
+        return dict(zip(PLANET_NAMES, (np.abs(diff).max(axis=0) * 3600).tolist()))
+
+ephemeris_table = EphemerisTable.load(os.environ["EPHEMERIS_TABLE_PATH"]) if os.environ.get("EPHEMERIS_TABLE_PATH") else None
+
+def get_planet_positions_array(jds, ayanamsa=DEFAULT_AYANAMSA):
+    """
+    (N, 9) sidereal longitudes in PLANETS order for an array of Julian days,
+    from the ephemeris table when one is loaded for `ayanamsa` and covers them.
+    """
+    jds = np.asarray(jds, dtype=np.float64).ravel()
+    table = ephemeris_table
+    if table is not None and table.ayanamsa == ayanamsa and table.covers(jds):
+        return table.positions(jds)
+    out = np.empty((len(jds), len(PLANETS)))
+    for i, jd in enumerate(jds.tolist()):
+        with sidereal(ayanamsa):
+            for col, (name, code) in enumerate(PLANETS):
+                if col != KETU_COL:
+                    out[i, col] = swe.calc_ut(jd, code, swe.FLG_SIDEREAL)[0][0]
+    out[:, KETU_COL] = (out[:, RAHU_COL] + 180) % 360
+    return out
+
 def get_rasi_from_longitude(longitude):
     rasi_num = int(longitude // 30)
     rasi_name = RASI_LABELS[rasi_num]
@@ -110,23 +685,229 @@ def get_navamsa_rasi(longitude):
     navamsa_sign = (sign_num * 9 + pada) % 12
     return navamsa_sign, RASI_LABELS[navamsa_sign]
 
-def get_maandi_longitude(sun_long, weekday, hour, minute, dt, lat, lon):
-    try:
-        import astral
-        from astral.sun import sun
-        from astral import LocationInfo
-        city = LocationInfo(latitude=lat, longitude=lon)
-        sun_times = sun(city.observer, date=dt.date())
-        sunrise = sun_times["sunrise"].astimezone(dt.tzinfo)
-        sunset = sun_times["sunset"].astimezone(dt.tzinfo)
-        curr_time = dt
-        is_morning = curr_time < sunset
-    except Exception:
-        is_morning = hour < 18
-    key = "Sunday Monday Tuesday Wednesday Thursday Friday Saturday".split()[weekday]
-    add_deg = MAANDI_DEGREES[key][0 if is_morning else 1]
-    maandi_long = (sun_long + add_deg) % 360
-    return maandi_long
+# --- divisional charts ---
+VARGA_NAMES = {
+    1: "Rasi", 2: "Hora", 3: "Drekkana", 4: "Chaturthamsa", 7: "Saptamsa", 9: "Navamsa",
+    10: "Dasamsa", 12: "Dwadasamsa", 16: "Shodasamsa", 20: "Vimsamsa", 24: "Chaturvimsamsa",
+    27: "Saptavimsamsa", 30: "Trimsamsa", 40: "Khavedamsa", 45: "Akshavedamsa", 60: "Shashtiamsa",
+}
+VARGAS = tuple(VARGA_NAMES)
+# trimsamsa spans and their signs for odd and even rasis
+TRIMSAMSA_BOUNDS = np.array([[5, 10, 18, 25], [5, 12, 20, 25]], dtype=np.float64)
+TRIMSAMSA_SIGNS = np.array([[0, 10, 8, 2, 6], [1, 5, 11, 9, 7]], dtype=np.int64)
+
+def varga_number(chart_type):
+    # 9, "D9", "d9" and "navamsa" all name the same chart
+    text = str(chart_type).strip().lower()
+    for n, name in VARGA_NAMES.items():
+        if text == name.lower():
+            return n
+    digits = text[1:] if text.startswith("d") else text
+    n = int(digits) if digits.isdigit() else None
+    if n not in VARGA_NAMES:
+        raise ValueError(f"Unknown divisional chart {chart_type!r}; expected one of D{', D'.join(map(str, VARGAS))}")
+    return n
+
+def divisional_signs(longitudes, vargas=VARGAS):
+    """
+    Sign index (0 = Mesha) of each longitude in each of `vargas` (Parashari
+    rules), as an int8 array of shape (len(vargas),) + longitudes.shape.
+    Any input shape works: (bodies,) for one chart, (charts, bodies) for a batch.
+    """
+    lon = np.asarray(longitudes, dtype=np.float64) % 360
+    sign = (lon // 30).astype(np.int64)
+    deg = lon - sign * 30
+    even = sign % 2            # 0 for odd signs (Mesha, Mithuna, ...)
+    quality = sign % 3         # movable, fixed, dual
+    out = np.empty((len(vargas),) + lon.shape, dtype=np.int8)
+    for i, n in enumerate(vargas):
+        part = np.minimum(deg // (30 / n), n - 1).astype(np.int64)
+        if n == 1:
+            result = sign
+        elif n == 2:
+            result = np.where(part == even, 4, 3)
+        elif n == 3:
+            result = sign + 4 * part
+        elif n == 4:
+            result = sign + 3 * part
+        elif n == 7:
+            result = sign + 6 * even + part
+        elif n == 9:
+            result = sign * 9 + part
+        elif n == 10:
+            result = sign + 8 * even + part
+        elif n in (12, 60):
+            result = sign + part
+        elif n in (16, 45):
+            result = 4 * quality + part
+        elif n == 20:
+            result = np.choose(quality, (0, 8, 4)) + part
+        elif n == 24:
+            result = 4 - even + part
+        elif n == 27:
+            result = 3 * (sign % 4) + part
+        elif n == 30:
+            spans = (deg[..., None] >= TRIMSAMSA_BOUNDS[even]).sum(axis=-1)
+            result = TRIMSAMSA_SIGNS[even, spans]
+        elif n == 40:
+            result = 6 * even + part
+        else:
+            raise ValueError(f"Unknown divisional chart D{n}")
+        out[i] = result % 12
+    return out
+
+def chart_bodies(planet_positions, ascendant, maandi_long):
+    # body order used by the chart boxes: Lagna, the planets, Maandi
+    names = ["Lagna", *planet_positions, "Maandi"]
+    return names, np.array([ascendant, *planet_positions.values(), maandi_long])
+
+def get_divisional_boxes(planet_positions, ascendant, maandi_long, vargas=VARGAS):
+    """
+    {varga: boxes} for each of `vargas`, computed in one divisional_signs pass.
+    """
+    names, longitudes = chart_bodies(planet_positions, ascendant, maandi_long)
+    signs = divisional_signs(longitudes, vargas).tolist()
+    charts = {}
+    for n, row in zip(vargas, signs):
+        boxes = [[] for _ in range(12)]
+        for name, sign in zip(names, row):
+            boxes[sign].append(PLANET_ABBR[name])
+        charts[n] = boxes
+    return charts
+
+# --- sunrise / sunset ---
+SUN_GRID_DEGREES = float(os.environ.get("SUN_GRID_DEGREES", "0.01"))
+SUN_CACHE_SIZE = int(os.environ.get("SUN_CACHE_SIZE", "65536"))
+# "limb": upper limb with refraction; "hindu": disc centre, no refraction
+SUNRISE_FLAGS = {"limb": 0, "hindu": swe.BIT_HINDU_RISING}[os.environ.get("SUNRISE_MODE", "limb")]
+WEEKDAY_LORDS = ("Sun", "Moon", "Mars", "Mercury", "Jupiter", "Venus", "Saturn")
+KALA_UPAGRAHAS = {"Kala": "Sun", "Mrityu": "Mars", "Ardhaprahara": "Mercury", "Yamaghantaka": "Jupiter", "Gulika": "Saturn"}
+
+SunTimes = namedtuple("SunTimes", ["sunrise", "sunset", "next_sunrise", "weekday"])
+
+def _local_day(jd, lon):
+    # civil day number in local mean time; (day + 1) % 7 is the weekday, 0 = Sunday
+    return int(np.floor(jd + 0.5 + lon / 360))
+
+def _sun_event(start_jd, rsmi, lat, lon):
+    # first rise/set within a day of start_jd; local mean 06:00/18:00 when the Sun never crosses the horizon
+    res, tret = swe.rise_trans(start_jd, swe.SUN, rsmi | SUNRISE_FLAGS, (lon, lat, 0.0))
+    if res == 0 and tret[0] < start_jd + 1:
+        return tret[0]
+    midnight = float(np.floor(start_jd + 0.5 + lon / 360)) - 0.5 - lon / 360
+    return midnight + (0.25 if rsmi == swe.CALC_RISE else 0.75)
+
+@lru_cache(maxsize=SUN_CACHE_SIZE)
+def _sun_times_cell(day, lat_cell, lon_cell):
+    lat, lon = lat_cell * SUN_GRID_DEGREES, lon_cell * SUN_GRID_DEGREES
+    midnight = day - 0.5 - lon / 360
+    sunrise = _sun_event(midnight, swe.CALC_RISE, lat, lon)
+    sunset = _sun_event(sunrise, swe.CALC_SET, lat, lon)
+    next_sunrise = _sun_event(max(sunset, midnight + 1), swe.CALC_RISE, lat, lon)
+    return SunTimes(sunrise, sunset, next_sunrise, (day + 1) % 7)
+
+def sun_times(jd, lat, lon):
+    """
+    SunTimes (Julian days, UT) of the Vedic day containing jd, i.e. the one
+    that began at the last sunrise. Cached per local day and location
+    quantized to SUN_GRID_DEGREES.
+    """
+    lat_cell, lon_cell = round(lat / SUN_GRID_DEGREES), round(lon / SUN_GRID_DEGREES)
+    day = _local_day(jd, lon)
+    times = _sun_times_cell(day, lat_cell, lon_cell)
+    if jd < times.sunrise:
+        times = _sun_times_cell(day - 1, lat_cell, lon_cell)
+    return times
+
+SUN_SEMIDIAMETER = 959.63 / 3600  # degrees at 1 AU
+SIDEREAL_RATE = 360.98564736629  # degrees of sidereal time per day
+
+def sun_times_year(year, lat, lon):
+    """
+    Sunrise, sunset and next-sunrise Julian days for every civil day of
+    `year` at one location, as a (days, 3) array. The whole year is solved
+    at once without sun_times()' cache: the Sun's altitude comes from daily
+    equatorial samples, crossings of the horizon found on a 10-minute grid
+    are refined with _refine_roots, and the horizon (refraction, and the
+    semidiameter for SUNRISE_MODE=limb) is calibrated against one
+    swe.rise_trans. Agrees with sun_times() within a second, apart from
+    days where the Sun grazes the horizon and rise_trans itself wavers.
+    """
+    lat = round(lat / SUN_GRID_DEGREES) * SUN_GRID_DEGREES
+    lon = round(lon / SUN_GRID_DEGREES) * SUN_GRID_DEGREES
+    first = _local_day(swe.julday(year, 1, 1, 12.0), 0.0)
+    last = _local_day(swe.julday(year + 1, 1, 1, 12.0), 0.0)
+    midnights = np.arange(first, last) - 0.5 - lon / 360
+    start = midnights[0] - 1
+    samples = start + np.arange(len(midnights) + 5)
+    # right ascension, declination (mod 360) and sidereal time less its mean rotation, with rates
+    data, distance = np.empty((len(samples), 3, 2)), np.empty(len(samples))
+    for k, jd in enumerate(samples.tolist()):
+        ret, flag = swe.calc_ut(jd, swe.SUN, swe.FLG_EQUATORIAL | swe.FLG_SPEED)
+        data[k] = (ret[0], ret[3]), (ret[1] % 360, ret[4]), ((swe.sidtime(jd) * 15 - SIDEREAL_RATE * (jd - start)) % 360, 0.0)
+        distance[k] = ret[2]
+    table = EphemerisTable(data, start)
+
+    def altitude(jds, lat=lat):
+        # true altitude of the Sun's centre and its rate, degrees and degrees/day
+        (ra, dec, st), (ra_rate, dec_rate, st_rate) = (a.T for a in table.interpolate(jds))
+        phi, dec = np.radians(lat), np.radians((dec + 180) % 360 - 180)
+        hour = np.radians(st + SIDEREAL_RATE * (jds - start) + lon - ra)
+        alt = np.arcsin(np.sin(phi) * np.sin(dec) + np.cos(phi) * np.cos(dec) * np.cos(hour))
+        rate = (-np.cos(phi) * np.cos(dec) * np.sin(hour) * (st_rate + SIDEREAL_RATE - ra_rate)
+                + (np.sin(phi) * np.cos(dec) - np.cos(phi) * np.sin(dec) * np.cos(hour)) * dec_rate) / np.cos(alt)
+        return np.degrees(alt), rate
+
+    def semidiameter(jds):
+        return 0.0 if SUNRISE_FLAGS & swe.BIT_DISC_CENTER else SUN_SEMIDIAMETER / np.interp(jds, samples, distance)
+
+    # the equator always has a sunrise to calibrate against
+    for cal_lat in (lat, 0.0):
+        res, tret = swe.rise_trans(midnights[0], swe.SUN, swe.CALC_RISE | SUNRISE_FLAGS, (lon, cal_lat, 0.0))
+        if res == 0 and tret[0] < midnights[0] + 1:
+            break
+    horizon = altitude(np.array([tret[0]]), cal_lat)[0][0] + semidiameter(tret[0])
+
+    grid = np.arange(midnights[0], midnights[-1] + 3, 1 / 144)
+    target = horizon - np.broadcast_to(semidiameter(grid), grid.shape)
+    above = altitude(grid)[0] >= target
+    rising = np.flatnonzero(~above[:-1] & above[1:])
+    setting = np.flatnonzero(above[:-1] & ~above[1:])
+    rises = _refine_roots(altitude, grid[rising], grid[rising + 1], target[rising], tol=1e-6)
+    sets = _refine_roots(altitude, grid[setting], grid[setting + 1], target[setting], tol=1e-6)
+
+    def next_event(starts, events, fallback):
+        # first event within a day after each start, else local mean 06:00/18:00 as in _sun_event
+        found = np.append(events, np.inf)[np.searchsorted(events, starts, side="right")]
+        midnight = np.floor(starts + 0.5 + lon / 360) - 0.5 - lon / 360
+        return np.where(found < starts + 1, found, midnight + fallback)
+
+    sunrise = next_event(midnights, rises, 0.25)
+    sunset = next_event(sunrise, sets, 0.75)
+    return np.stack([sunrise, sunset, next_event(np.maximum(sunset, midnights + 1), rises, 0.25)], axis=1)
+
+def upagraha_portion(jd, lat, lon, lord):
+    """
+    (start, end) of `lord`'s eighth of the day or night containing jd. Day
+    portions follow the weekday order from the lord of the weekday, night
+    portions from the lord of the fifth weekday; the eighth has no lord.
+    """
+    times = sun_times(jd, lat, lon)
+    if jd < times.sunset:
+        begin, end, first = times.sunrise, times.sunset, times.weekday
+    else:
+        begin, end, first = times.sunset, times.next_sunrise, (times.weekday + 4) % 7
+    k = (WEEKDAY_LORDS.index(lord) - first) % 7
+    part = (end - begin) / 8
+    return begin + k * part, begin + (k + 1) * part
+
+def upagraha_longitude(name, jd, lat, lon, ayanamsa=DEFAULT_AYANAMSA):
+    # time-based upagrahas rise with the lagna at the start of their lord's portion
+    start, end = upagraha_portion(jd, lat, lon, KALA_UPAGRAHAS[name])
+    return get_ascendant_and_houses(start, lat, lon, ayanamsa)[0]
+
+def get_maandi_longitude(jd, lat, lon, ayanamsa=DEFAULT_AYANAMSA):
+    return upagraha_longitude("Gulika", jd, lat, lon, ayanamsa)
 
 def get_full_planet_table(planet_positions, ascendant, maandi_long):
     result = []
@@ -170,49 +951,28 @@ def get_full_planet_table(planet_positions, ascendant, maandi_long):
     return result
 
 def get_chart_boxes(planet_positions, ascendant, maandi_long, chart_type="rasi"):
-    boxes = [[] for _ in range(12)]
-    if chart_type == "rasi":
-        lagna_rasi_num, _ = get_rasi_from_longitude(ascendant)
-        boxes[lagna_rasi_num].append(PLANET_ABBR["Lagna"])
-    elif chart_type == "navamsa":
-        lagna_nav_num, _ = get_navamsa_rasi(ascendant)
-        boxes[lagna_nav_num].append(PLANET_ABBR["Lagna"])
-    for planet, lon in planet_positions.items():
-        if chart_type == "rasi":
-            box_num, _ = get_rasi_from_longitude(lon)
-        else:
-            box_num, _ = get_navamsa_rasi(lon)
-        abbr = PLANET_ABBR[planet]
-        boxes[box_num].append(abbr)
-    if chart_type == "rasi":
-        box_num, _ = get_rasi_from_longitude(maandi_long)
-    else:
-        box_num, _ = get_navamsa_rasi(maandi_long)
-    boxes[box_num].append(PLANET_ABBR["Maandi"])
-    return boxes
+    n = varga_number(chart_type)
+    return get_divisional_boxes(planet_positions, ascendant, maandi_long, (n,))[n]
+
+SOUTH_CHART_ORDER = [11, 0, 1, 2,
+                     10, None, None, 3,
+                     9, None, None, 4,
+                     8, 7, 6, 5]
 
 def html_south_chart(boxes, chart_title="Rasi"):
-    sign_order = [11, 0, 1, 2,
-                  10, None, None, 3,
-                  9, None, None, 4,
-                  8, 7, 6, 5]
-    center_label = chart_title
-    table = '<table class="south-chart">'
-    idx = 0
+    cells = ['<table class="south-chart">']
     for r in range(4):
-        table += "<tr>"
+        cells.append("<tr>")
         for c in range(4):
-            si = sign_order[idx]
-            idx += 1
+            si = SOUTH_CHART_ORDER[r*4 + c]
             if si is None:
                 if r == 1 and c == 1:
-                    table += f'<td class="center" rowspan="2" colspan="2" style="font-size:22px;font-weight:bold;text-align:center;vertical-align:middle;">{center_label}</td>'
+                    cells.append(f'<td class="center" rowspan="2" colspan="2" style="font-size:22px;font-weight:bold;text-align:center;vertical-align:middle;">{chart_title}</td>')
             else:
-                planets = " ".join(boxes[si])
-                table += f'<td><b>{RASI_LABELS[si]}</b><br>{planets}</td>'
-        table += "</tr>"
-    table += "</table>"
-    return table
+                cells.append(f'<td><b>{RASI_LABELS[si]}</b><br>{" ".join(boxes[si])}</td>')
+        cells.append("</tr>")
+    cells.append("</table>")
+    return "".join(cells)
 
 def get_bhava_table(ascendant, planet_positions, maandi_long):
     lagna_rasi_num, lagna_rasi = get_rasi_from_longitude(ascendant)
@@ -231,9 +991,7 @@ def get_bhava_table(ascendant, planet_positions, maandi_long):
         })
     return houses
 
-def vimshottari_tree(moon_longitude, birthdt, levels=5):
-    def period(years, start):
-        return (start, start + timedelta(days=years*365.25))
+def _vim_balance(moon_longitude):
     nak_num = int(moon_longitude // (360/27))
     seq_idx = nak_num % 9
     nakshatra_size = 360/27
@@ -242,340 +1000,1400 @@ def vimshottari_tree(moon_longitude, birthdt, levels=5):
     pos_in_nak = (moon_longitude % nakshatra_size) / nakshatra_size
     elapsed = pos_in_nak * dasa_years
     remaining = dasa_years - elapsed
+    return seq_idx, remaining
+
+def vimshottari_mahadashas(moon_longitude, birthdt):
+    seq_idx, remaining = _vim_balance(moon_longitude)
     out = []
-    dasha_seq = VIM_SEQ * 3
-    dasha_idx = seq_idx
     dasha_start = birthdt
     for d in range(9):
-        dasha_lord = dasha_seq[dasha_idx % 9]
-        dasha_len = VIM_YEARS[dasha_lord]
-        if d == 0:
-            dasha_len = remaining
+        dasha_lord = VIM_SEQ[(seq_idx + d) % 9]
+        dasha_len = remaining if d == 0 else VIM_YEARS[dasha_lord]
         dasha_end = dasha_start + timedelta(days=dasha_len*365.25)
-        dasha_item = {
+        out.append({
             "lord": dasha_lord, "start": dasha_start, "end": dasha_end, "years": dasha_len, "children": []
-        }
-        if levels >= 2:
-            bhukti_idx = dasha_idx
-            bhukti_start = dasha_start
-            for b in range(9):
-                bhukti_lord = dasha_seq[(bhukti_idx + b) % 9]
-                bhukti_len = dasha_len * VIM_YEARS[bhukti_lord] / 120
-                bhukti_end = bhukti_start + timedelta(days=bhukti_len*365.25)
-                bhukti_item = {
-                    "lord": bhukti_lord, "start": bhukti_start, "end": bhukti_end, "years": bhukti_len, "children": []
-                }
-                if levels >= 3:
-                    antar_start = bhukti_start
-                    for a in range(9):
-                        antar_lord = dasha_seq[(bhukti_idx + a) % 9]
-                        antar_len = bhukti_len * VIM_YEARS[antar_lord] / 120
-                        antar_end = antar_start + timedelta(days=antar_len*365.25)
-                        antar_item = {
-                            "lord": antar_lord, "start": antar_start, "end": antar_end, "years": antar_len, "children": []
-                        }
-                        if levels >= 4:
-                            sukshma_start = antar_start
-                            for s in range(9):
-                                sukshma_lord = dasha_seq[(bhukti_idx + s) % 9]
-                                sukshma_len = antar_len * VIM_YEARS[sukshma_lord] / 120
-                                sukshma_end = sukshma_start + timedelta(days=sukshma_len*365.25)
-                                sukshma_item = {
-                                    "lord": sukshma_lord, "start": sukshma_start, "end": sukshma_end, "years": sukshma_len, "children": []
-                                }
-                                if levels >= 5:
-                                    prana_start = sukshma_start
-                                    for p in range(9):
-                                        prana_lord = dasha_seq[(bhukti_idx + p) % 9]
-                                        prana_len = sukshma_len * VIM_YEARS[prana_lord] / 120
-                                        prana_end = prana_start + timedelta(days=prana_len*365.25)
-                                        prana_item = {
-                                            "lord": prana_lord, "start": prana_start, "end": prana_end, "years": prana_len
-                                        }
-                                        sukshma_item.setdefault("children", []).append(prana_item)
-                                        prana_start = prana_end
-                                antar_item.setdefault("children", []).append(sukshma_item)
-                                sukshma_start = sukshma_end
-                        bhukti_item.setdefault("children", []).append(antar_item)
-                        antar_start = antar_end
-                dasha_item.setdefault("children", []).append(bhukti_item)
-                bhukti_start = bhukti_end
-        out.append(dasha_item)
+        })
         dasha_start = dasha_end
-        dasha_idx += 1
     return out
 
-import pandas as pd
+def vimshottari_subperiods(seq_idx, start, years):
+    """
+    The nine sub-periods of a period of `years` beginning at `start`, taken in
+    VIM_SEQ order from seq_idx (the mahadasha lord, at every depth).
+    """
+    out = []
+    for b in range(9):
+        lord = VIM_SEQ[(seq_idx + b) % 9]
+        length = years * VIM_YEARS[lord] / 120
+        end = start + timedelta(days=length*365.25)
+        out.append({"lord": lord, "start": start, "end": end, "years": length, "children": []})
+        start = end
+    return out
+
+def vimshottari_children(moon_longitude, birthdt, path):
+    """
+    Sub-periods of the node reached by following `path` (lords from the mahadasha
+    down), computed without building the rest of the tree.
+    """
+    if not 1 <= len(path) < VIM_LEVELS:
+        raise ValueError(f"path must name 1 to {VIM_LEVELS - 1} lords")
+    items = vimshottari_mahadashas(moon_longitude, birthdt)
+    for depth, lord in enumerate(path, start=1):
+        node = next((i for i in items if i["lord"] == lord), None)
+        if node is None:
+            raise ValueError(f"unknown lord {lord!r} at depth {depth}")
+        if depth == 1:
+            seq_idx = VIM_SEQ.index(lord)
+        items = vimshottari_subperiods(seq_idx, node["start"], node["years"])
+    return items
+
+# Sub-period boundaries as fractions of the parent period, per starting VIM_SEQ index
+VIM_SUB_FRACTIONS = np.array([
+    np.concatenate(([0.0], np.cumsum([VIM_YEARS[VIM_SEQ[(s + k) % 9]] for k in range(9)]) / 120))
+    for s in range(9)
+])
+_VIM_SUB_FRACTIONS = VIM_SUB_FRACTIONS.tolist()
+
+def datetime_to_jd(dt):
+    ut_dt = dt.astimezone(pytz.utc)
+    return swe.julday(ut_dt.year, ut_dt.month, ut_dt.day,
+                      ut_dt.hour + ut_dt.minute/60 + (ut_dt.second + ut_dt.microsecond/1e6)/3600)
+
+def _vim_mahadasha_bounds(moon_longitude):
+    seq_idx, remaining = _vim_balance(moon_longitude)
+    bounds = [0.0, remaining*365.25]
+    for d in range(1, 9):
+        bounds.append(bounds[-1] + VIM_YEARS[VIM_SEQ[(seq_idx + d) % 9]]*365.25)
+    return seq_idx, bounds
 
-def calculate_ashtakavarga(jd, planet_positions):
+def vimshottari_period_at(moon_longitude, birthdt, when, depth=3):
     """
-    Computes a simplified Sarva Ashtakavarga:
-    - Each planet gets points (bindus) for signs based on sample logic.
-    - Returns: DataFrame (12 signs x 8 planets) and Sarva Ashtakavarga total.
-    You can replace the inner logic with classical rules as you build out!
+    Periods running at `when`, mahadasha first, down to `depth` levels (1-5).
+    Descends arithmetically through the period boundaries instead of building
+    a tree. Returns a list of {"lord", "start", "end", "years"} dicts, or None
+    when `when` falls outside the 120-year cycle.
     """
-    planets = ["Sun", "Moon", "Mars", "Mercury", "Jupiter", "Venus", "Saturn", "Lagna"]
-    rasi_labels = [
-        "Mesha", "Vrishabha", "Mithuna", "Karka", "Simha", "Kanya",
-        "Tula", "Vrischika", "Dhanu", "Makara", "Kumbha", "Meena"
+    seq_idx, bounds = _vim_mahadasha_bounds(moon_longitude)
+    t = (when - birthdt).total_seconds() / 86400
+    if not bounds[0] <= t < bounds[-1]:
+        return None
+    k = bisect_right(bounds, t) - 1
+    sub_seq = (seq_idx + k) % 9
+    fractions = _VIM_SUB_FRACTIONS[sub_seq]
+    start, end = bounds[k], bounds[k + 1]
+    spans = [(sub_seq, start, end)]
+    for _ in range(depth - 1):
+        length = end - start
+        j = min(bisect_right([start + f*length for f in fractions[1:9]], t), 8)
+        start, end = start + fractions[j]*length, start + fractions[j + 1]*length
+        spans.append(((sub_seq + j) % 9, start, end))
+    return [
+        {
+            "lord": VIM_SEQ[s],
+            "start": birthdt + timedelta(days=a),
+            "end": birthdt + timedelta(days=b),
+            "years": (b - a) / 365.25
+        }
+        for s, a, b in spans
     ]
-    # Initialize all to zero
-    av_table = {rasi: {p: 0 for p in planets} for rasi in rasi_labels}
-
-    # Simplest demo: give 1 point to the sign the planet is in
-    for p in planets:
-        if p == "Lagna":
-            lag_long = planet_positions["Lagna"]
-            rasi_num, rasi = get_rasi_from_longitude(lag_long)
-            av_table[rasi][p] += 1
-        elif p in planet_positions:
-            lon = planet_positions[p]
-            rasi_num, rasi = get_rasi_from_longitude(lon)
-            av_table[rasi][p] += 1
-
-    # Compute Sarva Ashtakavarga (total per sign)
-    sarva = []
-    for rasi in rasi_labels:
-        total = sum(av_table[rasi].values())
-        av_table[rasi]["Total"] = total
-        sarva.append(total)
-
-    # Convert to DataFrame for HTML/table
-    df = pd.DataFrame(av_table).T[planets + ["Total"]]
-    df.index.name = "Sign"
-    return df
-
-@app.route("/", methods=["GET", "POST"])
-def main():
-    output = ""
-    planet_table = []
-    dasa_table = []
-    bhava_table = []
-    vim_tree = []
-    resolved_loc = ""
-    if request.method == "POST":
-        dob = request.form.get("dob")
-        tob = request.form.get("tob")
-        location_str = request.form.get("location")
-        if dob and tob and location_str:
-            geolocator = Nominatim(user_agent="astro_kp_app")
-            loc = geolocator.geocode(location_str)
-            if not loc:
-                return "Could not find location. Please enter a valid city/town.", 400
-            lat, lon = loc.latitude, loc.longitude
-            tf = TimezoneFinder()
-            tz_str = tf.timezone_at(lat=lat, lng=lon) or "Asia/Kolkata"
-            resolved_loc = f"{loc.address} (lat: {lat:.4f}, lon: {lon:.4f}, tz: {tz_str})"
-            jd, dt, ut_dt = get_julian_day(*map(int, dob.split('-')), *map(int, tob.split(':')), 0, tz_str)
-            ascendant, house_cusps = get_ascendant_and_houses(jd, lat, lon)
-            planet_positions = get_planet_positions(jd)
-            sun_long = planet_positions["Sun"]
-            weekday = dt.weekday()
-            weekday = (weekday+1)%7
-            hour = dt.hour
-            minute = dt.minute
-            maandi_long = get_maandi_longitude(sun_long, weekday, hour, minute, dt, lat, lon)
-            planet_table = get_full_planet_table(planet_positions, ascendant, maandi_long)
-            rasi_boxes = get_chart_boxes(planet_positions, ascendant, maandi_long, chart_type="rasi")
-            nav_boxes = get_chart_boxes(planet_positions, ascendant, maandi_long, chart_type="navamsa")
-            rasi_chart_html = html_south_chart(rasi_boxes, chart_title="Rasi")
-            navamsa_chart_html = html_south_chart(nav_boxes, chart_title="Navamsa")
-            moon_long = planet_positions["Moon"]
-            dasa_tree = vimshottari_tree(moon_long, dt, levels=5)
-            vim_tree = dasa_tree
-            dasa_table = vimshottari_tree(moon_long, dt, levels=1)
-            bhava_table = get_bhava_table(ascendant, planet_positions, maandi_long)
-            output = f"""
+
+def vimshottari_periods_at(moon_longitude, birthdt, whens, depth=3):
+    """
+    Vectorized vimshottari_period_at for many query datetimes of one chart,
+    e.g. one per day for a period timeline. Returns (lords, start_jd, end_jd),
+    each shaped (len(whens), depth): lords are int8 VIM_SEQ indices (-1 outside
+    the 120-year cycle) and start/end are Julian days (NaN outside the cycle).
+    """
+    seq_idx, bounds = _vim_mahadasha_bounds(moon_longitude)
+    bounds = np.asarray(bounds)
+    t = np.fromiter(((w - birthdt).total_seconds() for w in whens), dtype=np.float64) / 86400
+    n = len(t)
+    valid = (t >= bounds[0]) & (t < bounds[-1])
+    k = np.clip(np.searchsorted(bounds, t, side="right") - 1, 0, 8)
+    sub_seq = (seq_idx + k) % 9
+    fractions = VIM_SUB_FRACTIONS[sub_seq]
+    start, end = bounds[k], bounds[k + 1]
+    lords = np.empty((n, depth), dtype=np.int8)
+    starts = np.empty((n, depth))
+    ends = np.empty((n, depth))
+    lords[:, 0], starts[:, 0], ends[:, 0] = sub_seq, start, end
+    rows = np.arange(n)
+    for level in range(1, depth):
+        length = end - start
+        inner = start[:, None] + fractions[:, 1:9]*length[:, None]
+        j = (inner <= t[:, None]).sum(axis=1)
+        start, end = start + fractions[rows, j]*length, start + fractions[rows, j + 1]*length
+        lords[:, level], starts[:, level], ends[:, level] = (sub_seq + j) % 9, start, end
+    lords[~valid] = -1
+    starts[~valid] = np.nan
+    ends[~valid] = np.nan
+    birth_jd = datetime_to_jd(birthdt)
+    return lords, birth_jd + starts, birth_jd + ends
+
+class DashaPeriod:
+    """
+    View of one period held in a VimshottariArrays engine.
+    """
+    __slots__ = ("engine", "level", "index")
+
+    def __init__(self, engine, level, index):
+        self.engine = engine
+        self.level = level
+        self.index = index
+
+    @property
+    def lord(self):
+        return VIM_SEQ[self.engine.lords[self.level - 1][self.index]]
+
+    @property
+    def start_jd(self):
+        return float(self.engine.start_jd[self.level - 1][self.index])
+
+    @property
+    def end_jd(self):
+        return float(self.engine.end_jd[self.level - 1][self.index])
+
+    @property
+    def start(self):
+        return self.engine.to_datetime(self.start_jd)
+
+    @property
+    def end(self):
+        return self.engine.to_datetime(self.end_jd)
+
+    @property
+    def years(self):
+        return (self.end_jd - self.start_jd) / 365.25
+
+    @property
+    def children(self):
+        if self.level >= self.engine.levels:
+            return []
+        return [DashaPeriod(self.engine, self.level + 1, 9*self.index + k) for k in range(9)]
+
+    def __repr__(self):
+        return f"DashaPeriod(level={self.level}, lord={self.lord!r}, start_jd={self.start_jd:.5f}, end_jd={self.end_jd:.5f})"
+
+class VimshottariArrays:
+    """
+    Every Vimshottari period down to `levels` (1-5), stored per level as
+    contiguous arrays: lords (int8 VIM_SEQ indices) and start_jd/end_jd
+    (float64 Julian days, UT). Period i of level n has children 9*i .. 9*i+8
+    in level n+1.
+    """
+    def __init__(self, moon_longitude, birthdt, levels=5):
+        self.birthdt = birthdt
+        self.birth_jd = datetime_to_jd(birthdt)
+        self.levels = levels
+        seq_idx, bounds = _vim_mahadasha_bounds(moon_longitude)
+        bounds = np.asarray(bounds)
+        root_seq = (seq_idx + np.arange(9)) % 9
+        lords = [root_seq.astype(np.int8)]
+        starts, ends = [bounds[:-1]], [bounds[1:]]
+        for _ in range(1, levels):
+            length = ends[-1] - starts[-1]
+            edges = starts[-1][:, None] + VIM_SUB_FRACTIONS[root_seq]*length[:, None]
+            starts.append(edges[:, :-1].ravel())
+            ends.append(edges[:, 1:].ravel())
+            lords.append(((root_seq[:, None] + np.arange(9)) % 9).astype(np.int8).ravel())
+            root_seq = np.repeat(root_seq, 9)
+        self.lords = lords
+        self.start_jd = [self.birth_jd + s for s in starts]
+        self.end_jd = [self.birth_jd + e for e in ends]
+
+    def to_datetime(self, jd):
+        return self.birthdt + timedelta(days=jd - self.birth_jd)
+
+    def periods(self, level=1):
+        return [DashaPeriod(self, level, i) for i in range(len(self.lords[level - 1]))]
+
+    def __iter__(self):
+        return iter(self.periods(1))
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for arrays in (self.lords, self.start_jd, self.end_jd) for a in arrays)
+
+    def to_tree(self):
+        birthdt = self.birthdt
+        children = []
+        for level in reversed(range(self.levels)):
+            starts = [birthdt + timedelta(days=d) for d in (self.start_jd[level] - self.birth_jd).tolist()]
+            # siblings are contiguous, so only the last of each group of nine needs its own end
+            ends = starts[1:] + [None]
+            for i, d in enumerate((self.end_jd[level][8::9] - self.birth_jd).tolist()):
+                ends[9*i + 8] = birthdt + timedelta(days=d)
+            years = ((self.end_jd[level] - self.start_jd[level]) / 365.25).tolist()
+            lords = [VIM_SEQ[lord] for lord in self.lords[level].tolist()]
+            if level == 0:
+                years[1:] = [VIM_YEARS[lord] for lord in lords[1:]]
+            children = [
+                {"lord": lords[i], "start": starts[i], "end": ends[i], "years": years[i], "children": children[9*i:9*i + 9]}
+                for i in range(len(lords))
+            ]
+        return children
+
+def vimshottari_tree(moon_longitude, birthdt, levels=5):
+    return VimshottariArrays(moon_longitude, birthdt, levels).to_tree()
+
+# --- KP sub divisions ---
+def _kp_sub_table():
+    # integer arithmetic in ninths of a degree: a nakshatra is 120, a sub of lord L is VIM_YEARS[L]
+    subs = []
+    for n in range(27):
+        pos, star = 120 * n, n % 9
+        for j in range(9):
+            subs.append((pos, star, (star + j) % 9))
+            pos += VIM_YEARS[VIM_SEQ[(star + j) % 9]]
+    starts = [s[0] for s in subs]
+    bounds = sorted(set(starts) | {270 * k for k in range(12)})
+    rows = [subs[bisect_right(starts, b) - 1] for b in bounds]
+    return (
+        np.array(bounds) / 9,
+        np.array([r[1] for r in rows], dtype=np.int8),
+        np.array([r[2] for r in rows], dtype=np.int8),
+        np.array([b // 270 for b in bounds], dtype=np.int8),
+    )
+
+# 249 divisions: the 243 star/sub spans, split where a sign boundary falls inside one
+KP_SUB_BOUNDS, KP_SUB_STAR_LORD, KP_SUB_LORD, KP_SUB_RASI = _kp_sub_table()
+
+def _kp_sub_sub_table():
+    # integer arithmetic in 1/1080 degree: a nakshatra is 14400, a sub of lord L is 120 * VIM_YEARS[L]
+    # and a sub-sub of lord M within it VIM_YEARS[L] * VIM_YEARS[M]
+    rows = []
+    for n in range(27):
+        pos, star = 14400 * n, n % 9
+        for j in range(9):
+            sub = (star + j) % 9
+            for m in range(9):
+                rows.append((pos, star, sub, (sub + m) % 9))
+                pos += VIM_YEARS[VIM_SEQ[sub]] * VIM_YEARS[VIM_SEQ[(sub + m) % 9]]
+    starts = [r[0] for r in rows]
+    bounds = sorted(set(starts) | {32400 * k for k in range(12)})
+    return (
+        np.array(bounds) / 1080,
+        np.array([rows[bisect_right(starts, b) - 1][1:] for b in bounds], dtype=np.int8),
+    )
+
+# the 2187 star/sub/sub-sub spans, again split at sign boundaries; lords as VIM_SEQ indices
+KP_SUB_SUB_BOUNDS, KP_SUB_SUB_LORDS = _kp_sub_sub_table()
+KP_LEVELS = ("sign_lord", "star_lord", "sub_lord", "sub_sub_lord")
+KP_SIGNIFICATOR_LEVELS = ("star_of_occupants", "occupants", "star_of_owners", "owners")
+VIM_TO_PLANET = np.array([PLANET_NAMES.index(lord) for lord in VIM_SEQ], dtype=np.int8)
+RASI_LORD_PLANET = np.array([PLANET_NAMES.index(RASI_LORDS[r]) for r in RASI_LABELS], dtype=np.int8)
+
+def kp_lords(longitudes):
+    """
+    Sign, star, sub and sub-sub lords of longitudes of any shape, e.g.
+    (charts, bodies), as PLANETS columns of shape (..., 4) in KP_LEVELS
+    order: one binary search per longitude in the sub-sub table.
+    """
+    lon = np.asarray(longitudes, dtype=np.float64) % 360
+    i = np.searchsorted(KP_SUB_SUB_BOUNDS, lon, side="right") - 1
+    out = np.empty(lon.shape + (4,), dtype=np.int8)
+    out[..., 0] = RASI_LORD_PLANET[(lon // 30).astype(np.intp)]
+    out[..., 1:] = VIM_TO_PLANET[KP_SUB_SUB_LORDS[i]]
+    return out
+
+def kp_house_positions(longitudes, cusps):
+    """
+    House (0-11) of each of `longitudes` (..., bodies) for `cusps` (..., 12):
+    the house whose cusp the body passed last.
+    """
+    cusps = np.asarray(cusps, dtype=np.float64)
+    offset = (np.asarray(longitudes, dtype=np.float64) - cusps[..., :1]) % 360
+    cusp_offset = (cusps - cusps[..., :1]) % 360
+    return (cusp_offset[..., None, :] <= offset[..., :, None]).sum(axis=-1) - 1
+
+def kp_significators_batch(planet_longitudes, cusps):
+    """
+    KP significators for planet longitudes (..., 9) in PLANETS order and
+    cusps (..., 12), as booleans of shape (..., 12, 4, 9): [h, level, p] is
+    set when planet p signifies house h at that KP_SIGNIFICATOR_LEVELS level
+    (in the star of an occupant, occupant, in the star of the owner, owner).
+    """
+    cusps = np.asarray(cusps, dtype=np.float64)
+    star = kp_lords(planet_longitudes)[..., 1].astype(np.intp)
+    house = kp_house_positions(planet_longitudes, cusps)
+    planets = np.arange(len(PLANETS))
+    occupants = house[..., None, :] == np.arange(12)[:, None]
+    owners = RASI_LORD_PLANET[(cusps // 30).astype(np.intp) % 12][..., None] == planets
+    # planet p is in the star of a house's occupant (owner) when that row is set at star[p]
+    stars = np.broadcast_to(star[..., None, :], occupants.shape)
+    in_star_of_occupants = np.take_along_axis(occupants, stars, axis=-1)
+    in_star_of_owners = np.take_along_axis(owners, stars, axis=-1)
+    return np.stack([in_star_of_occupants, occupants, in_star_of_owners, owners], axis=-2)
+
+def kp_table(planet_positions, house_cusps):
+    """
+    KP details for one chart: "cusps" and "planets" with their sign, star,
+    sub and sub-sub lords (planets also with their house), "significators"
+    as one {"house", <level>: [planets]...} row per house and
+    "planet_houses", the houses each planet signifies at any level.
+    """
+    longitudes = np.array([planet_positions[name] for name in PLANET_NAMES])
+    cusps = np.asarray(house_cusps, dtype=np.float64)[:12]
+    lords = kp_lords(np.concatenate([cusps, longitudes])).tolist()
+    houses = kp_house_positions(longitudes, cusps).tolist()
+    significators = kp_significators_batch(longitudes, cusps)
+
+    def describe(longitude, row):
+        return {"longitude": longitude, **{level: PLANET_NAMES[p] for level, p in zip(KP_LEVELS, row)}}
+
+    return {
+        "cusps": [{"house": h + 1, **describe(c, row)} for h, (c, row) in enumerate(zip(cusps.tolist(), lords))],
+        "planets": [{"planet": name, "house": house + 1, **describe(lon, row)}
+                    for name, lon, row, house in zip(PLANET_NAMES, longitudes.tolist(), lords[12:], houses)],
+        "significators": [
+            {"house": h + 1, **{level: [PLANET_NAMES[p] for p in np.flatnonzero(row)]
+                                for level, row in zip(KP_SIGNIFICATOR_LEVELS, levels)}}
+            for h, levels in enumerate(significators)
+        ],
+        "planet_houses": {name: (np.flatnonzero(significators[:, :, p].any(axis=1)) + 1).tolist()
+                          for p, name in enumerate(PLANET_NAMES)},
+    }
+
+# --- transit search ---
+TRANSIT_DIVISIONS = {
+    "rasi": (np.arange(12) * 30.0, RASI_LABELS),
+    "nakshatra": (np.arange(27) * 40 / 3, NAKSHATRA_NAMES),
+    "pada": (np.arange(108) * 10 / 3, [f"{NAKSHATRA_NAMES[k // 4]} {k % 4 + 1}" for k in range(108)]),
+    "navamsa": (np.arange(108) * 10 / 3, [RASI_LABELS[k % 12] for k in range(108)]),
+    "kp_sub": (KP_SUB_BOUNDS, [
+        f"{RASI_LABELS[r]} {VIM_SEQ[s]}/{VIM_SEQ[b]}" for r, s, b in zip(KP_SUB_RASI, KP_SUB_STAR_LORD, KP_SUB_LORD)
+    ]),
+}
+UNIX_EPOCH_JD = 2440587.5
+
+def jd_to_datetime(jd, tz=pytz.utc):
+    return (datetime(1970, 1, 1, tzinfo=pytz.utc) + timedelta(days=jd - UNIX_EPOCH_JD)).astimezone(tz)
+
+def _body_longitudes(col, jds, ayanamsa=DEFAULT_AYANAMSA):
+    """
+    Longitudes and speeds of PLANETS[col] at `jds`, from the ephemeris table
+    when it covers them and swe.calc_ut otherwise.
+    """
+    jds = np.asarray(jds, dtype=np.float64)
+    table = ephemeris_table
+    if table is not None and table.ayanamsa == ayanamsa and table.covers(jds):
+        return table.interpolate(jds, col)
+    code = PLANETS[RAHU_COL if col == KETU_COL else col][1]
+    lon, speed = np.empty(len(jds)), np.empty(len(jds))
+    for i, jd in enumerate(jds.tolist()):
+        with sidereal(ayanamsa):
+            ret, flag = swe.calc_ut(jd, code, swe.FLG_SIDEREAL | swe.FLG_SPEED)
+        lon[i], speed[i] = ret[0], ret[3]
+    if col == KETU_COL:
+        lon = (lon + 180) % 360
+    return lon, speed
+
+def _split_at_stations(col, grid, lon, speed, ayanamsa, iterations=40):
+    # insert each station (speed sign change) as a sample so every interval is monotonic
+    flips = np.flatnonzero(np.sign(speed[:-1]) * np.sign(speed[1:]) < 0)
+    if not flips.size:
+        return grid, lon, speed
+    lo, hi, s_lo = grid[flips], grid[flips + 1], speed[flips]
+    for _ in range(iterations):
+        mid = (lo + hi) / 2
+        same = np.sign(_body_longitudes(col, mid, ayanamsa)[1]) == np.sign(s_lo)
+        lo, hi = np.where(same, mid, lo), np.where(same, hi, mid)
+    station = (lo + hi) / 2
+    st_lon, st_speed = _body_longitudes(col, station, ayanamsa)
+    return (np.insert(grid, flips + 1, station), np.insert(lon, flips + 1, st_lon),
+            np.insert(speed, flips + 1, st_speed))
+
+def _boundary_count(x, bounds):
+    # boundaries at or below x along the unwrapped longitude
+    turns = np.floor(x / 360)
+    return (turns * len(bounds)).astype(np.int64) + np.searchsorted(bounds, x - turns*360, side="right")
+
+def _refine_roots(values, lo, hi, target, tol=1e-7, max_iter=60):
+    """
+    Bracketed Newton iteration for the instants in [lo, hi] at which an angle
+    equals `target` (degrees); values(jds) returns the angle and its rate in
+    degrees per day. Steps that would leave the bracket fall back to bisection.
+    """
+    def offset(jds, targets):
+        angle, rate = values(jds)
+        return (angle - targets + 180) % 360 - 180, rate
+
+    lo, hi = lo.copy(), hi.copy()
+    f_lo, _ = offset(lo, target)
+    f_hi, _ = offset(hi, target)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = np.where(f_hi != f_lo, lo - f_lo * (hi - lo) / (f_hi - f_lo), (lo + hi) / 2)
+    t = np.clip(t, lo, hi)
+    active = np.arange(len(t))
+    for _ in range(max_iter):
+        if not active.size:
+            break
+        f, speed = offset(t[active], target[active])
+        same = np.sign(f) == np.sign(f_lo[active])
+        lo[active] = np.where(same, t[active], lo[active])
+        f_lo[active] = np.where(same, f, f_lo[active])
+        hi[active] = np.where(same, hi[active], t[active])
+        done = (np.abs(f) < tol) | (hi[active] - lo[active] < 1e-9)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            step = t[active] - f / speed
+        inside = (step > lo[active]) & (step < hi[active])
+        t[active] = np.where(done, t[active], np.where(inside, step, (lo[active] + hi[active]) / 2))
+        active = active[~done]
+    return t
+
+def _refine_crossings(col, lo, hi, target, ayanamsa, tol=1e-7, max_iter=60):
+    # instants in [lo, hi] at which the longitude of PLANETS[col] equals `target`
+    return _refine_roots(lambda jds: _body_longitudes(col, jds, ayanamsa), lo, hi, target, tol, max_iter)
+
+def find_transits(start_jd, end_jd, planets=None, divisions=None, ayanamsa=DEFAULT_AYANAMSA, step=1.0):
+    """
+    Every boundary crossing of the chosen TRANSIT_DIVISIONS by the chosen
+    planets between two Julian days (UT), sorted by time. Longitudes are
+    sampled every `step` days and stations found between samples split the
+    scan, so a retrograde re-crossing shows up as its own event; each
+    crossing is then refined to ~1e-7 degree. Fast over long ranges when an
+    ephemeris table covering them is loaded.
+    """
+    planets = planets or PLANET_NAMES
+    divisions = divisions or list(TRANSIT_DIVISIONS)
+    events = []
+    for planet in planets:
+        col = PLANET_NAMES.index(planet)
+        grid = np.append(np.arange(start_jd, end_jd, step), end_jd)
+        lon, speed = _body_longitudes(col, grid, ayanamsa)
+        grid, lon, speed = _split_at_stations(col, grid, lon, speed, ayanamsa)
+        path = lon[0] + np.concatenate(([0.0], np.cumsum((np.diff(lon) + 180) % 360 - 180)))
+        refined = {}  # pada and navamsa share boundaries
+        for division in divisions:
+            bounds, labels = TRANSIT_DIVISIONS[division]
+            before, after = _boundary_count(path[:-1], bounds), _boundary_count(path[1:], bounds)
+            counts = np.abs(after - before)
+            if not counts.any():
+                continue
+            interval = np.repeat(np.arange(len(counts)), counts)
+            first = np.minimum(before, after)[interval]
+            j = first + np.arange(len(interval)) - np.repeat(np.cumsum(counts) - counts, counts)
+            forward = path[interval + 1] > path[interval]
+            target = bounds[j % len(bounds)]
+            key = (len(bounds), bounds[1])
+            if key not in refined:
+                refined[key] = _refine_crossings(col, grid[interval], grid[interval + 1], target, ayanamsa)
+            jds = refined[key]
+            entered = np.where(forward, j, j - 1) % len(bounds)
+            left = np.where(forward, j - 1, j) % len(bounds)
+            for jd, prev, nxt, fwd in zip(jds.tolist(), left.tolist(), entered.tolist(), forward.tolist()):
+                events.append({
+                    "jd": jd, "planet": planet, "division": division,
+                    "from": labels[prev], "to": labels[nxt], "retrograde": not fwd
+                })
+    events.sort(key=lambda e: e["jd"])
+    return events
+
+def next_transit(planet, division, after_jd, to=None, ayanamsa=DEFAULT_AYANAMSA, max_days=36525):
+    """
+    First crossing of `division` by `planet` after `after_jd`, optionally the
+    first one entering the segment labelled `to` (e.g. "Rohini"); None if
+    there is none within max_days.
+    """
+    window = 32.0 if planet == "Moon" else 400.0
+    start, stop = after_jd, after_jd + max_days
+    while start < stop:
+        end = min(start + window, stop)
+        for event in find_transits(start, end, [planet], [division], ayanamsa):
+            if event["jd"] > after_jd and (to is None or event["to"] == to):
+                return event
+        start = end
+    return None
+
+# --- ashtakavarga ---
+ASHTAKAVARGA_PLANETS = ("Sun", "Moon", "Mars", "Mercury", "Jupiter", "Venus", "Saturn")
+ASHTAKAVARGA_CONTRIBUTORS = ASHTAKAVARGA_PLANETS + ("Lagna",)
+# benefic houses counted from each contributor, per planet (Brihat Parashara Hora Shastra)
+ASHTAKAVARGA_HOUSES = {
+    "Sun": ((1, 2, 4, 7, 8, 9, 10, 11), (3, 6, 10, 11), (1, 2, 4, 7, 8, 9, 10, 11), (3, 5, 6, 9, 10, 11, 12),
+            (5, 6, 9, 11), (6, 7, 12), (1, 2, 4, 7, 8, 9, 10, 11), (3, 4, 6, 10, 11, 12)),
+    "Moon": ((3, 6, 7, 8, 10, 11), (1, 3, 6, 7, 10, 11), (2, 3, 5, 6, 9, 10, 11), (1, 3, 4, 5, 7, 8, 10, 11),
+             (1, 4, 7, 8, 10, 11, 12), (3, 4, 5, 7, 9, 10, 11), (3, 5, 6, 11), (3, 6, 10, 11)),
+    "Mars": ((3, 5, 6, 10, 11), (3, 6, 11), (1, 2, 4, 7, 8, 10, 11), (3, 5, 6, 11),
+             (6, 10, 11, 12), (6, 8, 11, 12), (1, 4, 7, 8, 9, 10, 11), (1, 3, 6, 10, 11)),
+    "Mercury": ((5, 6, 9, 11, 12), (2, 4, 6, 8, 10, 11), (1, 2, 4, 7, 8, 9, 10, 11), (1, 3, 5, 6, 9, 10, 11, 12),
+                (6, 8, 11, 12), (1, 2, 3, 4, 5, 8, 9, 11), (1, 2, 4, 7, 8, 9, 10, 11), (1, 2, 4, 6, 8, 10, 11)),
+    "Jupiter": ((1, 2, 3, 4, 7, 8, 9, 10, 11), (2, 5, 7, 9, 11), (1, 2, 4, 7, 8, 10, 11), (1, 2, 4, 5, 6, 9, 10, 11),
+                (1, 2, 3, 4, 7, 8, 10, 11), (2, 5, 6, 9, 10, 11), (3, 5, 6, 12), (1, 2, 4, 5, 6, 7, 9, 10, 11)),
+    "Venus": ((8, 11, 12), (1, 2, 3, 4, 5, 8, 9, 11, 12), (3, 5, 6, 9, 11, 12), (3, 5, 6, 9, 11),
+              (5, 8, 9, 10, 11), (1, 2, 3, 4, 5, 8, 9, 10, 11), (3, 4, 5, 8, 9, 10, 11), (1, 2, 3, 4, 5, 8, 9, 11)),
+    "Saturn": ((1, 2, 4, 7, 8, 10, 11), (3, 6, 11), (3, 5, 6, 10, 11, 12), (6, 8, 9, 10, 11, 12),
+               (5, 6, 11, 12), (6, 11, 12), (3, 5, 6, 11), (1, 3, 4, 6, 10, 11)),
+}
+# 12-bit masks, bit h-1 set for each benefic house h: shape (planet, contributor)
+ASHTAKAVARGA_MASKS = np.array(
+    [[sum(1 << (h - 1) for h in houses) for houses in ASHTAKAVARGA_HOUSES[p]] for p in ASHTAKAVARGA_PLANETS],
+    dtype=np.uint32
+)
+_SIGN_BITS = np.arange(12, dtype=np.uint32)
+
+def ashtakavarga_batch(contributor_signs):
+    """
+    Bhinnashtakavarga bindus for contributor rasis of shape (..., 8) in
+    ASHTAKAVARGA_CONTRIBUTORS order, e.g. (charts, 8). Each contributor's
+    house mask is rotated to start at its own sign, so the result has shape
+    (..., 7, 12) with [p, s] the bindus planet p gets in sign s. Summing
+    over axis -2 gives the Sarvashtakavarga.
+    """
+    signs = np.asarray(contributor_signs, dtype=np.uint32)[..., None, :]
+    rotated = ((ASHTAKAVARGA_MASKS << signs) | (ASHTAKAVARGA_MASKS >> (12 - signs))) & 0xFFF
+    bits = (rotated[..., None] >> _SIGN_BITS) & 1
+    return bits.sum(axis=-2, dtype=np.uint8)
+
+def calculate_ashtakavarga(planet_positions, ascendant, as_frame=False):
+    """
+    Bhinna and Sarva Ashtakavarga for one chart as
+    {"bhinna": {planet: [12 bindus]}, "sarva": [12 bindus]}, indexed from Mesha;
+    with as_frame=True, a pandas DataFrame of signs x planets plus "Total".
+    """
+    longitudes = [planet_positions[p] for p in ASHTAKAVARGA_PLANETS] + [ascendant]
+    bhinna = ashtakavarga_batch((np.asarray(longitudes) // 30).astype(np.int64) % 12)
+    if as_frame:
+        import pandas as pd
+        frame = pd.DataFrame(bhinna.T, index=pd.Index(RASI_LABELS, name="Sign"), columns=ASHTAKAVARGA_PLANETS)
+        frame["Total"] = frame.sum(axis=1)
+        return frame
+    return {
+        "bhinna": dict(zip(ASHTAKAVARGA_PLANETS, bhinna.tolist())),
+        "sarva": bhinna.sum(axis=0).tolist(),
+    }
+
+# --- compatibility matching ---
+# Every table below is indexed by moon pada 0-107 (27 nakshatras x 4 padas);
+# pada p lies in nakshatra p // 4 and rasi p // 9. Pair matrices are [groom, bride].
+PADAS = np.arange(108)
+PADA_NAKSHATRA = PADAS // 4
+PADA_RASI = PADAS // 9
+
+NAKSHATRA_GANA = np.array([0, 1, 2, 1, 0, 1, 0, 0, 2, 2, 1, 1, 0, 2, 0, 2, 0, 2,
+                           2, 1, 1, 0, 2, 2, 1, 1, 0])  # deva, manushya, rakshasa
+YONI_ANIMALS = ("Horse", "Elephant", "Sheep", "Serpent", "Dog", "Cat", "Rat",
+                "Cow", "Buffalo", "Tiger", "Deer", "Monkey", "Mongoose", "Lion")
+NAKSHATRA_YONI = np.array([0, 1, 2, 3, 3, 4, 5, 2, 5, 6, 6, 7, 8, 9, 8, 9, 10, 10,
+                           4, 11, 12, 11, 13, 0, 13, 7, 1])
+YONI_SCORES = np.array([
+    [4, 2, 2, 3, 2, 2, 2, 1, 0, 1, 3, 3, 2, 1],
+    [2, 4, 3, 3, 2, 2, 2, 2, 3, 1, 2, 3, 2, 0],
+    [2, 3, 4, 2, 1, 2, 1, 3, 3, 1, 2, 0, 3, 1],
+    [3, 3, 2, 4, 2, 1, 1, 1, 1, 2, 2, 2, 0, 2],
+    [2, 2, 1, 2, 4, 2, 1, 2, 2, 1, 0, 2, 1, 1],
+    [2, 2, 2, 1, 2, 4, 0, 2, 2, 1, 3, 3, 2, 1],
+    [2, 2, 1, 1, 1, 0, 4, 2, 2, 2, 2, 2, 1, 2],
+    [1, 2, 3, 1, 2, 2, 2, 4, 3, 0, 3, 2, 2, 1],
+    [0, 3, 3, 1, 2, 2, 2, 3, 4, 1, 2, 2, 2, 1],
+    [1, 1, 1, 2, 1, 1, 2, 0, 1, 4, 1, 1, 2, 1],
+    [3, 2, 2, 2, 0, 3, 2, 3, 2, 1, 4, 2, 2, 1],
+    [3, 3, 0, 2, 2, 3, 2, 2, 2, 1, 2, 4, 3, 2],
+    [2, 2, 3, 0, 1, 2, 1, 2, 2, 2, 2, 3, 4, 2],
+    [1, 0, 1, 2, 1, 1, 2, 1, 1, 1, 1, 2, 2, 4],
+])
+NAKSHATRA_NADI = np.array([0, 1, 2, 2, 1, 0])[np.arange(27) % 6]  # adi, madhya, antya
+NAKSHATRA_RAJJU = np.array([0, 1, 2, 3, 4, 3, 2, 1, 0])[np.arange(27) % 9]  # pada, kati, nabhi, kanta, siro
+VEDHA_PAIRS = ((0, 17), (1, 16), (2, 15), (3, 14), (4, 13), (4, 22), (13, 22), (5, 21),
+               (6, 20), (7, 19), (8, 18), (9, 26), (10, 25), (11, 24), (12, 23))
+RASI_VARNA = np.array([2, 1, 0, 3] * 3)  # shudra < vaishya < kshatriya < brahmin
+# chatushpada, manava, jalachara, vanachara, keeta; Dhanu and Makara change at 15 degrees
+RASI_VASHYA = ((0, 0), (0, 0), (1, 1), (2, 2), (3, 3), (1, 1), (1, 1), (4, 4), (1, 0), (0, 2), (1, 1), (2, 2))
+VASHYA_SCORES = np.array([
+    [2, 1, 1, 0.5, 1],
+    [1, 2, 0.5, 0, 1],
+    [1, 0.5, 2, 1, 1],
+    [0, 0, 0, 2, 0],
+    [1, 1, 1, 0, 2],
+])
+# the signs each rasi holds in vasya (South Indian porutham)
+RASI_VASYA = ((4, 7), (3, 6), (5,), (7, 8), (6,), (11, 2), (9, 5), (3,), (11,), (0, 10), (0,), (9,))
+# natural relationship of the row planet to the column planet: 0 enemy, 1 neutral, 2 friend
+NATURAL_RELATIONS = np.array([
+    [2, 2, 2, 1, 2, 0, 0],
+    [2, 2, 1, 2, 1, 1, 1],
+    [2, 2, 2, 0, 2, 1, 1],
+    [2, 0, 1, 2, 1, 2, 1],
+    [2, 2, 2, 0, 2, 0, 1],
+    [0, 0, 1, 2, 1, 2, 2],
+    [0, 0, 0, 2, 1, 2, 2],
+])  # ASHTAKAVARGA_PLANETS order
+MAITRI_SCORES = np.array([[0, 0.5, 1], [0.5, 3, 4], [1, 4, 5]])
+RASI_LORD_INDEX = np.array([ASHTAKAVARGA_PLANETS.index(RASI_LORDS[r]) for r in RASI_LABELS])
+
+def _pada_pairs():
+    groom, bride = PADAS[:, None], PADAS[None, :]
+    return (PADA_NAKSHATRA[groom], PADA_NAKSHATRA[bride], PADA_RASI[groom], PADA_RASI[bride],
+            groom % 9 * 10 / 3 < 15, bride % 9 * 10 / 3 < 15)
+
+def _ashtakoota_tables():
+    gn, bn, gr, br, g_first, b_first = _pada_pairs()
+    vashya = np.array([v[0] for v in RASI_VASHYA]), np.array([v[1] for v in RASI_VASHYA])
+    g_vashya = np.where(g_first, vashya[0][gr], vashya[1][gr])
+    b_vashya = np.where(b_first, vashya[0][br], vashya[1][br])
+    tara_ok = lambda count: ~np.isin(count % 9, (3, 5, 7))
+    g_lord, b_lord = RASI_LORD_INDEX[gr], RASI_LORD_INDEX[br]
+    return {
+        "varna": (RASI_VARNA[gr] >= RASI_VARNA[br]) * 1.0,
+        "vashya": VASHYA_SCORES[g_vashya, b_vashya],
+        "tara": 1.5 * tara_ok((gn - bn) % 27 + 1) + 1.5 * tara_ok((bn - gn) % 27 + 1),
+        "yoni": YONI_SCORES[NAKSHATRA_YONI[gn], NAKSHATRA_YONI[bn]] * 1.0,
+        "graha_maitri": MAITRI_SCORES[NATURAL_RELATIONS[g_lord, b_lord], NATURAL_RELATIONS[b_lord, g_lord]],
+        "gana": np.array([[6, 6, 0], [5, 6, 0], [1, 0, 6]])[NAKSHATRA_GANA[gn], NAKSHATRA_GANA[bn]] * 1.0,
+        "bhakoot": ~np.isin((br - gr) % 12, (1, 4, 5, 7, 8, 11)) * 7.0,
+        "nadi": (NAKSHATRA_NADI[gn] != NAKSHATRA_NADI[bn]) * 8.0,
+    }
+
+def _porutham_tables():
+    gn, bn, gr, br, _, _ = _pada_pairs()
+    count = (gn - bn) % 27 + 1  # groom's star counted from the bride's
+    sign_count = (gr - br) % 12 + 1
+    g_gana, b_gana = NAKSHATRA_GANA[gn], NAKSHATRA_GANA[bn]
+    g_lord, b_lord = RASI_LORD_INDEX[gr], RASI_LORD_INDEX[br]
+    vasya = np.zeros((12, 12), dtype=bool)
+    for r, held in enumerate(RASI_VASYA):
+        vasya[r, list(held)] = True
+    vedha = np.zeros((27, 27), dtype=bool)
+    for a, b in VEDHA_PAIRS:
+        vedha[a, b] = vedha[b, a] = True
+    return {
+        "dina": np.isin(count % 9, (0, 2, 4, 6, 8)),
+        "gana": (g_gana == b_gana) | ((g_gana < 2) & (b_gana < 2)),
+        "mahendra": np.isin(count, (4, 7, 10, 13, 16, 19, 22, 25)),
+        "stree_deergha": count > 13,
+        "yoni": YONI_SCORES[NAKSHATRA_YONI[gn], NAKSHATRA_YONI[bn]] >= 2,
+        "rasi": (sign_count == 1) | ((sign_count > 6) & (sign_count != 8)),
+        "rasyadhipati": (NATURAL_RELATIONS[g_lord, b_lord] > 0) & (NATURAL_RELATIONS[b_lord, g_lord] > 0),
+        "vasya": vasya[gr, br] | vasya[br, gr],
+        "rajju": NAKSHATRA_RAJJU[gn] != NAKSHATRA_RAJJU[bn],
+        "vedha": ~vedha[gn, bn],
+    }
+
+ASHTAKOOTA = {name: table.astype(np.float32) for name, table in _ashtakoota_tables().items()}
+ASHTAKOOTA_TOTAL = sum(ASHTAKOOTA.values())  # out of 36
+PORUTHAMS = _porutham_tables()
+PORUTHAM_MASKS = sum(table.astype(np.uint16) << i for i, table in enumerate(PORUTHAMS.values()))
+PORUTHAM_COUNT = sum(table.astype(np.uint8) for table in PORUTHAMS.values())  # out of 10
+MATCH_SYSTEMS = {"ashtakoota": (ASHTAKOOTA_TOTAL, ASHTAKOOTA), "porutham": (PORUTHAM_COUNT, PORUTHAMS)}
+BRIDE, GROOM = 0, 1
+
+def moon_pada(longitude):
+    return (np.asarray(longitude, dtype=np.float64) * 0.3 % 108).astype(np.uint8)
+
+def match_score(groom_moon, bride_moon, system="ashtakoota"):
+    """
+    Score and per-koota (or per-porutham) breakdown for one couple from their
+    moon longitudes.
+    """
+    total, parts = MATCH_SYSTEMS[system]
+    g, b = int(moon_pada(groom_moon)), int(moon_pada(bride_moon))
+    return {"score": total[g, b].item(), "parts": {name: table[g, b].item() for name, table in parts.items()}}
+
+class ProfileIndex:
+    """
+    Stored profiles as compact columns for matching: id (int64), sex
+    (BRIDE/GROOM), moon pada and lagna rasi (uint8), plus the key
+    sex * 108 + pada and a count of profiles per key. A query takes one
+    216-entry row of scores from the pada matrices, finds the score cut-off
+    for k profiles from the key counts, and gathers the profiles above it in
+    one vectorized pass.
+    """
+    def __init__(self, capacity=1024):
+        self.size = 0
+        self.ids = np.empty(capacity, dtype=np.int64)
+        self.sex = np.empty(capacity, dtype=np.uint8)
+        self.moon_pada = np.empty(capacity, dtype=np.uint8)
+        self.lagna = np.empty(capacity, dtype=np.uint8)
+        self._key = np.empty(capacity, dtype=np.uint8)
+        self._key_counts = np.zeros(216, dtype=np.int64)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.size
+
+    def _columns(self):
+        return self.ids, self.sex, self.moon_pada, self.lagna, self._key
+
+    def _append(self, ids, sex, padas, lagnas):
+        keys = sex.astype(np.uint8) * 108 + padas
+        with self._lock:
+            end = self.size + len(ids)
+            if end > len(self.ids):
+                capacity = max(end, 2 * len(self.ids))
+                self.ids, self.sex, self.moon_pada, self.lagna, self._key = (
+                    np.concatenate([column[:self.size], np.empty(capacity - self.size, column.dtype)])
+                    for column in self._columns()
+                )
+            for column, values in zip(self._columns(), (ids, sex, padas, lagnas, keys)):
+                column[self.size:end] = values
+            self._key_counts += np.bincount(keys, minlength=216)
+            self.size = end
+
+    def extend(self, ids, sex, moon_longitudes, ascendants):
+        ids = np.atleast_1d(np.asarray(ids, dtype=np.int64))
+        self._append(ids, np.broadcast_to(np.asarray(sex, dtype=np.uint8), ids.shape),
+                     np.atleast_1d(moon_pada(moon_longitudes)),
+                     np.atleast_1d((np.asarray(ascendants, dtype=np.float64) // 30 % 12).astype(np.uint8)))
+
+    def add(self, profile_id, sex, moon_longitude, ascendant):
+        self.extend([profile_id], sex, [moon_longitude], [ascendant])
+
+    def add_births(self, ids, sex, jds, lats, lons, ayanamsa=DEFAULT_AYANAMSA):
+        """
+        Index births from UT Julian days and coordinates; the moon comes from
+        get_planet_positions_array, the lagna from one house call each.
+        """
+        moons = get_planet_positions_array(jds, ayanamsa)[:, 1]
+        ascendants = [get_ascendant_and_houses(jd, lat, lon, ayanamsa)[0]
+                      for jd, lat, lon in zip(np.ravel(jds).tolist(), np.ravel(lats).tolist(), np.ravel(lons).tolist())]
+        self.extend(ids, sex, moons, ascendants)
+
+    def top_matches(self, moon_longitude, sex, k=10, system="ashtakoota", min_score=0, where=None):
+        """
+        Best k profiles of the opposite sex for a chart with this moon, as
+        [{"id", "score", "nakshatra", "pada", "rasi", "lagna", "parts"}], best
+        first and equal scores in index order. `where` is an optional boolean
+        mask over the index to restrict the candidates (e.g. age or location
+        filters).
+        """
+        total, parts = MATCH_SYSTEMS[system]
+        q = int(moon_pada(moon_longitude))
+        # score per key; -1 for the same sex
+        row = np.full(216, -1, dtype=np.float32)
+        row[(1 - sex) * 108:(2 - sex) * 108] = total[q, :] if sex == GROOM else total[:, q]
+        n = self.size
+        keys = self._key[:n]
+        counts = self._key_counts if where is None else np.bincount(keys[where[:n]], minlength=216)
+        order = np.argsort(-row, kind="stable")
+        reached = np.searchsorted(np.cumsum(counts[order]), k)
+        cutoff = max(row[order[min(reached, 215)]].item(), min_score, 0)
+        candidates = np.flatnonzero((row >= cutoff)[keys])
+        if where is not None:
+            candidates = candidates[where[candidates]]
+        scores = row[keys[candidates]]
+        above, tied = candidates[scores > cutoff], candidates[scores == cutoff]
+        top = np.concatenate([above, tied[:max(k - len(above), 0)]])
+        top = top[np.argsort(-row[keys[top]], kind="stable")][:k]
+        results = []
+        for i in top.tolist():
+            p = int(self.moon_pada[i])
+            g, b = (q, p) if sex == GROOM else (p, q)
+            results.append({
+                "id": int(self.ids[i]),
+                "score": total[g, b].item(),
+                "nakshatra": NAKSHATRA_NAMES[p // 4],
+                "pada": p % 4 + 1,
+                "rasi": RASI_LABELS[p // 9],
+                "lagna": RASI_LABELS[self.lagna[i]],
+                "parts": {name: table[g, b].item() for name, table in parts.items()},
+            })
+        return results
+
+    def save(self, path):
+        n = self.size
+        np.savez(path, ids=self.ids[:n], sex=self.sex[:n], moon_pada=self.moon_pada[:n], lagna=self.lagna[:n])
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            stored = [data[name] for name in ("ids", "sex", "moon_pada", "lagna")]
+        index = cls(capacity=max(len(stored[0]), 1))
+        index._append(*stored)
+        return index
+
+PROFILE_INDEX_PATH = os.environ.get("PROFILE_INDEX_PATH")
+profile_index = (ProfileIndex.load(PROFILE_INDEX_PATH)
+                 if PROFILE_INDEX_PATH and os.path.exists(PROFILE_INDEX_PATH) else ProfileIndex())
+
+# --- instrumentation ---
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class StageHistograms:
+    """
+    Cumulative latency histograms per stage, rendered in Prometheus text format.
+    """
+    def __init__(self, buckets=STAGE_BUCKETS):
+        self.buckets = buckets
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        i = bisect_left(self.buckets, seconds)
+        with self._lock:
+            counts = self._stages.setdefault(stage, [[0] * (len(self.buckets) + 1), 0.0])
+            counts[0][i] += 1
+            counts[1] += seconds
+
+    def render(self, name):
+        with self._lock:
+            snapshot = {stage: (list(counts), total) for stage, (counts, total) in self._stages.items()}
+        lines = [f"# HELP {name} Time spent in each request stage.", f"# TYPE {name} histogram"]
+        for stage, (counts, total) in sorted(snapshot.items()):
+            running = 0
+            for le, count in zip(self.buckets + ("+Inf",), counts):
+                running += count
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{le}"}} {running}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {total:.6f}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {running}')
+        return lines
+
+stage_metrics = StageHistograms()
+
+@contextmanager
+def timed(stage):
+    """
+    Records the block's wall time in stage_metrics and, inside a request, in
+    the request's Server-Timing header.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_metrics.observe(stage, elapsed)
+        if has_request_context():
+            g.setdefault("stage_timings", []).append((stage, elapsed))
+
+def _timed_stream(stage, chunks):
+    # streamed bodies finish after the headers are sent, so they only reach the histograms
+    with timed(stage):
+        yield from chunks
+
+def _cache_counts():
+    # {cache: {result: count}} for the caches worth watching
+    geocode = geocoder.stats()
+    charts = chart_cache.stats()
+    tz, sun = _timezone_at_cell.cache_info(), _sun_times_cell.cache_info()
+    return {
+        "geocode": {k[:-5]: geocode.get(k, 0) for k in ("memory_hits", "disk_hits", "gazetteer_hits")}
+                   | {"miss": geocode.get("misses", 0)},
+        "chart": {k[:-5]: charts.get(k, 0) for k in ("memory_hits", "disk_hits")} | {"miss": charts.get("misses", 0)},
+        "timezone": {"memory": tz.hits, "miss": tz.misses},
+        "sun_times": {"memory": sun.hits, "miss": sun.misses},
+    }
+
+def render_metrics():
+    lines = stage_metrics.render("birthchart_stage_seconds")
+    lines += ["# HELP birthchart_cache_lookups_total Cache lookups by tier that answered.",
+              "# TYPE birthchart_cache_lookups_total counter"]
+    ratios = []
+    for cache, counts in _cache_counts().items():
+        for result, count in counts.items():
+            lines.append(f'birthchart_cache_lookups_total{{cache="{cache}",result="{result}"}} {count}')
+        lookups = sum(counts.values())
+        ratios.append(f'birthchart_cache_hit_ratio{{cache="{cache}"}} '
+                      f'{(lookups - counts["miss"]) / lookups if lookups else 0.0:.4f}')
+    lines += ["# HELP birthchart_cache_hit_ratio Share of lookups answered without a miss.",
+              "# TYPE birthchart_cache_hit_ratio gauge", *ratios]
+    return "\n".join(lines) + "\n"
+
+# --- sampling profiler ---
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+_profile_every = int(os.environ.get("PROFILE_EVERY", 0))
+_profile_counter = 0
+_profile_lock = threading.Lock()
+
+def set_profile_rate(every):
+    """
+    Profile one request in `every` with cProfile (0 turns it off); takes
+    effect on the next request. Profiles are written to PROFILE_DIR.
+    """
+    global _profile_every, _profile_counter
+    with _profile_lock:
+        _profile_every, _profile_counter = max(0, int(every)), 0
+
+def _start_profile():
+    global _profile_counter
+    with _profile_lock:
+        if not _profile_every:
+            return None
+        _profile_counter += 1
+        if _profile_counter % _profile_every:
+            return None
+    import cProfile
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:  # another profiler is active in this interpreter
+        return None
+    return profiler
+
+def _finish_profile(profiler, endpoint):
+    profiler.disable()
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profiler.dump_stats(os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{endpoint}-{os.getpid()}-{time.perf_counter_ns()}.prof"))
+
+@bp.before_request
+def _before_request():
+    g.request_started = time.perf_counter()
+    g.profiler = _start_profile()
+
+@bp.after_request
+def _after_request(response):
+    if g.get("profiler") is not None:
+        _finish_profile(g.profiler, request.endpoint or "unknown")
+        g.profiler = None
+    total = time.perf_counter() - g.request_started
+    stage_metrics.observe("request", total)
+    timings = g.get("stage_timings", []) + [("total", total)]
+    response.headers["Server-Timing"] = ", ".join(f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in timings)
+    return response
+
+@bp.route("/metrics")
+def metrics():
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+@bp.route("/debug/profile", methods=["POST"])
+def debug_profile():
+    """
+    POST every=N with the PROFILER_TOKEN header to sample one request in N;
+    disabled (404) unless PROFILER_TOKEN is set.
+    """
+    token = os.environ.get("PROFILER_TOKEN")
+    if not token:
+        return "Not Found", 404
+    if request.headers.get("X-Profiler-Token") != token:
+        return jsonify(error="bad token"), 403
+    try:
+        set_profile_rate(request.values.get("every", 0))
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    return jsonify(every=_profile_every, directory=os.path.abspath(PROFILE_DIR))
+
+# --- chart cache ---
+CHART_CACHE_VERSION = "3"  # bump when chart output changes for the same input
+CHART_PAGE_LEVELS = 2
+CHART_CACHE_MAX_AGE = int(os.environ.get("CHART_CACHE_MAX_AGE", 86400))
+
+ChartEntry = namedtuple("ChartEntry", ["context", "html"])
+
+class ChartDiskCache:
+    """
+    Persistent chart page contexts and rendered HTML in SQLite, keyed by chart_key().
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS charts (key TEXT PRIMARY KEY, context BLOB, html TEXT)")
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT context, html FROM charts WHERE key = ?", (key,)).fetchone()
+        return ChartEntry(pickle.loads(row[0]), row[1]) if row else None
+
+    def put(self, key, entry):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO charts VALUES (?, ?, ?)",
+                (key, pickle.dumps(entry.context, pickle.HIGHEST_PROTOCOL), entry.html)
+            )
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM charts").fetchone()[0]
+
+class ChartCache:
+    """
+    Computed chart pages through an in-process LRU and an optional SQLite tier.
+    Entries hold the template context and, once a render has completed, the HTML.
+    """
+    def __init__(self, cache_size=256, cache_path=None):
+        self.memory = LRUCache(cache_size)
+        self.disk = ChartDiskCache(cache_path) if cache_path else None
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def _count(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    def get(self, key):
+        entry = self.memory.get(key)
+        if entry is not None:
+            self._count("memory_hits")
+            return entry
+        if self.disk is not None:
+            entry = self.disk.get(key)
+            if entry is not None:
+                self._count("disk_hits")
+                self.memory.put(key, entry)
+                return entry
+        self._count("misses")
+        return None
+
+    def put(self, key, entry):
+        self.memory.put(key, entry)
+        if self.disk is not None:
+            self.disk.put(key, entry)
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._counts)
+        counts["memory_size"] = len(self.memory)
+        return counts
+
+chart_cache = ChartCache(
+    cache_size=int(os.environ.get("CHART_CACHE_SIZE", 256)),
+    cache_path=os.environ.get("CHART_CACHE_PATH")
+)
+
+@lru_cache(maxsize=None)
+def _template_digest(template_name):
+    env = current_app.jinja_env
+    source, _, _ = env.loader.get_source(env, template_name)
+    return hashlib.sha1(source.encode("utf-8")).hexdigest()[:12]
+
+def chart_key(jd, lat, lon, ayanamsa, levels=CHART_PAGE_LEVELS, address=""):
+    """
+    Cache key and ETag for a chart page: the birth moment to the minute, the
+    coordinates to 4 decimals, ayanamsa and dasha depth, the resolved
+    address the page shows (two places can share coordinates), plus the
+    code and template versions so stale entries are never served after a change.
+    """
+    normalized = f"{round(jd * 1440)}|{lat:.4f}|{lon:.4f}|{ayanamsa}|{levels}|{address}"
+    version = f"{CHART_CACHE_VERSION}|{_template_digest('chart.html')}"
+    return hashlib.sha1(f"{normalized}|{version}".encode()).hexdigest()
+
+def chart_page_context(jd, dt, lat, lon, tz_str, address, ayanamsa=DEFAULT_AYANAMSA, levels=CHART_PAGE_LEVELS):
+    resolved_loc = f"{address} (lat: {lat:.4f}, lon: {lon:.4f}, tz: {tz_str})"
+    with timed("ephemeris"):
+        ascendant, house_cusps, house_system = get_houses(jd, lat, lon, ayanamsa)
+        planet_positions = get_planet_positions(jd, ayanamsa)
+    with timed("maandi"):
+        maandi_long = get_maandi_longitude(jd, lat, lon, ayanamsa)
+    with timed("tables"):
+        planet_table = get_full_planet_table(planet_positions, ascendant, maandi_long)
+        charts = get_divisional_boxes(planet_positions, ascendant, maandi_long, (1, 9))
+        rasi_chart_html = html_south_chart(charts[1], chart_title="Rasi")
+        navamsa_chart_html = html_south_chart(charts[9], chart_title="Navamsa")
+        bhava_table = get_bhava_table(ascendant, planet_positions, maandi_long)
+        ashtakavarga = calculate_ashtakavarga(planet_positions, ascendant)
+        kp = kp_table(planet_positions, house_cusps)
+        for row in kp["cusps"] + kp["planets"]:
+            row["position"] = f"{RASI_LABELS[int(row['longitude'] // 30)]} {format_rasi_dms(row['longitude'])}"
+    moon_long = planet_positions["Moon"]
+    with timed("dasha"):
+        vim_tree = vimshottari_tree(moon_long, dt, levels=levels)
+        dasa_table = vimshottari_tree(moon_long, dt, levels=1)
+    output = f"""
             <button onclick="window.print()" style="margin:12px 0;padding:6px 20px;font-size:16px;">Export to PDF / Print</button>
             <div style="color:#277; margin-bottom:10px;"><b>Resolved Location:</b> {resolved_loc}</div>
             <h3>KP (Lahiri new) South Indian Style Rasi and Navamsa Charts</h3>
             <div style="display:flex;gap:16px;">{rasi_chart_html}{navamsa_chart_html}</div>
             """
-    html = '''
-    <script>
-    function toggleNode(id) {
-      var node = document.getElementById('node-' + id);
-      var arrow = document.getElementById('arrow-' + id);
-      if(node.style.display === 'none') {
-        node.style.display = 'block';
-        if(arrow) arrow.textContent = '▼';
-      } else {
-        node.style.display = 'none';
-        if(arrow) arrow.textContent = '▶';
-      }
-    }
-    </script>
-    {% macro render_vim_tree_js(items, parent_id='d', level=1) -%}
-      <ul style="margin-left:{{level*12}}px;list-style:none;padding-left:0;">
-        {% for i in items %}
-          {% set node_id = parent_id ~ '-' ~ loop.index %}
-          <li>
-            <span onclick="toggleNode('{{node_id}}')" style="cursor:pointer;user-select:none;">
-              <b>
-                <span id="arrow-{{node_id}}">▶</span>
-                {{i.lord}}
-              </b>
-            </span>
-            <span style="font-size:90%;margin-left:4px;">
-              {{i.start.strftime("%Y-%m-%d")}} to {{i.end.strftime("%Y-%m-%d")}} ({{i.years|round(2)}}y)
-            </span>
-            {% if i.children %}
-            <div id="node-{{node_id}}" style="display:none;">
-              {{ render_vim_tree_js(i.children, node_id, level+1) }}
-            </div>
-            {% endif %}
-          </li>
-        {% endfor %}
-      </ul>
-    {%- endmacro %}
-    <html>
-    <head>
-    <title>KP South Indian Birth Chart</title>
-    <style>
-    @media print { body { background: #fff; } .south-chart td, .planet-table td, .dasa-table td { font-size:13px !important;}}
-    body { font-family: Arial, sans-serif; margin:30px;}
-    table.south-chart {border-collapse:collapse;}
-    table.south-chart td { width:90px; height:70px; border:2px solid #388e3c; text-align:center; vertical-align:top; font-size:18px; background:#fcffe6;}
-    table.south-chart .empty { background:none; border:none;}
-    .center { background:#f8eab8 !important; border:2px solid #888 !important;}
-    table.planet-table {border-collapse:collapse;margin-top:18px;}
-    table.planet-table td, table.planet-table th {border:1px solid #888;padding:3px 7px;}
-    table.dasa-table {border-collapse:collapse;margin-top:12px;}
-    table.dasa-table td, table.dasa-table th {border:1px solid #888;padding:2px 7px;}
-    </style>
-    </head>
-    <body>
-    <h2>KP/Lahiri South Indian Birth Chart Generator</h2>
-    <form method="post" style="margin-bottom:20px;">
-      <label>Date of Birth:</label>
-      <input type="date" name="dob" required>
-      <label>Time (24h):</label>
-      <input type="time" name="tob" required step="60">
-      <label>Location (type any city/town/village):</label>
-      <input type="text" name="location" required style="width:300px;" placeholder="e.g. Chennai, India">
-      <button type="submit">Generate Chart</button>
-    </form>
-    <hr>
-    {{output|safe}}
-    {% if planet_table %}
-    <h3>Planet & Lagna Details</h3>
-    <table class="planet-table">
-      <tr>
-        <th>Body</th><th>Longitude</th><th>Degree in Rasi</th><th>Nakshatra</th><th>Pada</th><th>Rasi</th><th>Navamsa</th>
-      </tr>
-      {% for p in planet_table %}
-      <tr>
-        <td>{{p.Body}}</td>
-        <td>{{p.Longitude}}</td>
-        <td>{{p.RasiDegree}}</td>
-        <td>{{p.Nakshatra}}</td>
-        <td>{{p.Pada}}</td>
-        <td>{{p.Rasi}}</td>
-        <td>{{p.Navamsa}}</td>
-      </tr>
-      {% endfor %}
-    </table>
-    {% endif %}
-    {% if dasa_table %}
-    <h3>Vimshottari Mahadasha</h3>
-    <table class="dasa-table">
-      <tr>
-        <th>Dasha Lord</th><th>Years</th><th>Start</th><th>End</th>
-      </tr>
-      {% for d in dasa_table %}
-      <tr>
-        <td>{{d.lord}}</td>
-        <td>{{d.years|round(2)}}</td>
-        <td>{{d.start.strftime("%Y-%m-%d")}}</td>
-        <td>{{d.end.strftime("%Y-%m-%d")}}</td>
-      </tr>
-      {% endfor %}
-    </table>
-    {% endif %}
-    {% if bhava_table %}
-    <h3>Bhava/House Table</h3>
-    <table class="planet-table">
-      <tr>
-        <th>House</th><th>Rasi</th><th>Lord</th><th>Navamsa Sign</th>
-      </tr>
-      {% for h in bhava_table %}
-      <tr>
-        <td>{{h.House}}</td>
-        <td>{{h.Rasi}}</td>
-        <td>{{h.Lord}}</td>
-        <td>{{h.Navamsa}}</td>
-      </tr>
-      {% endfor %}
-    </table>
-    {% endif %}
-    {% if vim_tree %}
-    <h3>Full Vimshottari Dasha → Bhukti → Antara → Sukshma → Prana<br>
-      <small style="font-weight:normal;">(Click ▶ to expand/▼ to collapse. Up to 120 years.)</small></h3>
-    <div style="font-family:monospace;font-size:15px;">
-      {{ render_vim_tree_js(vim_tree) }}
-    </div>
-    {% endif %}
-    </body>
-    </html>
-    '''
-    return render_template_string(
-        html,
+    return dict(
         output=output,
         planet_table=planet_table,
         dasa_table=dasa_table[0]['children'] if dasa_table and dasa_table[0].get('children') else [],
         bhava_table=bhava_table,
-        vim_tree=vim_tree
+        ashtakavarga=ashtakavarga,
+        kp=kp,
+        house_system=swe.house_name(house_system),
+        rasi_labels=RASI_LABELS,
+        vim_tree=vim_tree,
+        vim_chart={"moon": moon_long, "birth": dt.isoformat()},
+        max_level=VIM_LEVELS
+    )
+
+def _collect(chunks, on_complete):
+    parts = []
+    for chunk in chunks:
+        parts.append(chunk)
+        yield chunk
+    on_complete("".join(parts))
+
+def stream_page(template_name, on_complete=None, **context):
+    """
+    Streams a template in buffered chunks so the top of the page reaches the
+    browser while the rest is still rendering. Templates are compiled once
+    and kept by the Jinja environment (plus JINJA_BYTECODE_CACHE_DIR if set).
+    on_complete, if given, receives the full HTML once the stream finishes.
+    """
+    current_app.update_template_context(context)
+    stream = current_app.jinja_env.get_template(template_name).stream(**context)
+    stream.enable_buffering(64)
+    stream = _timed_stream("render", stream)
+    if on_complete is not None:
+        stream = _collect(stream, on_complete)
+    return Response(stream_with_context(stream), mimetype="text/html")
+
+@bp.route("/", methods=["GET", "POST"])
+def main():
+    if request.method == "POST":
+        dob = request.form.get("dob")
+        tob = request.form.get("tob")
+        location_str = request.form.get("location")
+        if dob and tob and location_str:
+            return redirect(url_for(".chart", dob=dob, tob=tob, location=location_str), code=303)
+    return stream_page(
+        "chart.html",
+        output="",
+        planet_table=[],
+        dasa_table=[],
+        bhava_table=[],
+        ashtakavarga={},
+        vim_tree=[],
+        vim_chart={},
+        max_level=VIM_LEVELS
     )
 
-def get_birthchart_full_output(dob, tob, place, query_datetime):
+@bp.route("/chart")
+def chart():
+    """
+    Chart page at a stable URL (?dob=YYYY-MM-DD&tob=HH:MM&location=...[&ayanamsa=...]);
+    lat= and lon= (or a "lat, lon" location) skip geocoding.
+    Pages are cached by chart_key(), which doubles as the ETag, so repeats are
+    answered from the cache or with a 304 and may be served by browsers and proxies.
+    """
+    dob = request.args.get("dob")
+    tob = request.args.get("tob")
+    location_str = request.args.get("location")
+    lat, lon = request.args.get("lat"), request.args.get("lon")
+    ayanamsa = request.args.get("ayanamsa", DEFAULT_AYANAMSA)
+    if not (dob and tob and (location_str or (lat and lon))):
+        return redirect(url_for(".main"))
+    if ayanamsa not in AYANAMSAS:
+        return f"Unknown ayanamsa {ayanamsa!r}.", 400
+    try:
+        with timed("geocode"):
+            loc = resolve_location(location_str, lat, lon)
+    except ValueError as e:
+        return str(e), 400
+    except GeocodeUnavailable:
+        return ("Location lookup is slow right now. Please try again shortly, "
+                "or enter the coordinates as 'lat, lon'.", 503, {"Retry-After": "5"})
+    if not loc:
+        return "Could not find location. Please enter a valid city/town.", 400
+    lat, lon = loc.latitude, loc.longitude
+    with timed("timezone"):
+        tz_str = timezone_at(lat, lon) or "Asia/Kolkata"
+    try:
+        local = parse_birth_datetime(dob, tob)
+    except ValueError as e:
+        return str(e), 400
+    jd, dt, ut_dt = get_julian_day(local.year, local.month, local.day, local.hour, local.minute, local.second, tz_str)
+    key = chart_key(jd, lat, lon, ayanamsa, address=loc.address)
+    if key in request.if_none_match:
+        response = Response(status=304)
+    else:
+        with timed("cache"):
+            entry = chart_cache.get(key)
+        if entry is None:
+            entry = ChartEntry(chart_page_context(jd, dt, lat, lon, tz_str, loc.address, ayanamsa), None)
+            chart_cache.put(key, entry)
+        if entry.html is not None:
+            response = Response(entry.html, mimetype="text/html")
+        else:
+            response = stream_page(
+                "chart.html",
+                on_complete=lambda html: chart_cache.put(key, entry._replace(html=html)),
+                **entry.context
+            )
+    response.set_etag(key)
+    response.cache_control.public = True
+    response.cache_control.max_age = CHART_CACHE_MAX_AGE
+    return response
+
+@bp.route("/dasha/children")
+def dasha_children():
+    try:
+        moon_long = float(request.args["moon"])
+        birthdt = datetime.fromisoformat(request.args["birth"])
+        path = [p for p in request.args.get("path", "").split(",") if p]
+        children = vimshottari_children(moon_long, birthdt, path)
+    except (KeyError, ValueError) as e:
+        return jsonify(error=str(e)), 400
+    expandable = len(path) + 1 < VIM_LEVELS
+    return jsonify([
+        {
+            "lord": c["lord"],
+            "start": c["start"].strftime("%Y-%m-%d"),
+            "end": c["end"].strftime("%Y-%m-%d"),
+            "years": round(c["years"], 2),
+            "expandable": expandable
+        }
+        for c in children
+    ])
+
+TRANSIT_MAX_DAYS = int(os.environ.get("TRANSIT_MAX_DAYS", "36525"))
+# without an ephemeris table every sample is a swe.calc_ut call (~2 s per planet-century),
+# so ranges the table does not cover are held to a few years
+TRANSIT_MAX_DAYS_UNTABLED = int(os.environ.get("TRANSIT_MAX_DAYS_UNTABLED", "1830"))
+
+@bp.route("/transits")
+def transits():
+    try:
+        start = datetime_to_jd(pytz.utc.localize(datetime.strptime(request.args["start"], "%Y-%m-%d")))
+        end = datetime_to_jd(pytz.utc.localize(datetime.strptime(request.args["end"], "%Y-%m-%d")))
+        planets = [p for p in request.args.get("planets", "").split(",") if p] or None
+        divisions = [d for d in request.args.get("divisions", "rasi").split(",") if d]
+        ayanamsa = request.args.get("ayanamsa", DEFAULT_AYANAMSA)
+        table = ephemeris_table
+        tabled = table is not None and table.ayanamsa == ayanamsa and table.covers([start, end])
+        max_days = TRANSIT_MAX_DAYS if tabled else min(TRANSIT_MAX_DAYS, TRANSIT_MAX_DAYS_UNTABLED)
+        if not 0 < end - start <= max_days:
+            raise ValueError(f"range must be 1 to {max_days} days"
+                             + ("" if tabled else " without an ephemeris table covering it (EPHEMERIS_TABLE_PATH)"))
+        unknown = set(planets or ()) - set(PLANET_NAMES) | set(divisions) - set(TRANSIT_DIVISIONS)
+        if unknown:
+            raise ValueError(f"unknown planet or division: {', '.join(sorted(unknown))}")
+        events = find_transits(start, end, planets, divisions, ayanamsa)
+    except (KeyError, ValueError) as e:
+        return jsonify(error=str(e)), 400
+    for event in events:
+        event["time"] = jd_to_datetime(event["jd"]).strftime("%Y-%m-%dT%H:%M:%SZ")
+    return jsonify(events)
+
+# --- birth-time rectification ---
+RECTIFY_DIVISIONS = {"Lagna": ("rasi", "navamsa", "pada", "kp_sub"), "Moon": ("pada",)}
+RECTIFY_STEP = 5 / 1440  # days between samples; crossings in between are counted, not missed
+
+def _ascendants(jds, lat, lon, ayanamsa=DEFAULT_AYANAMSA):
+    # sidereal ascendant and its rate (deg/day) from swe.houses_ex2, one call per instant
+    asc, speed = np.empty(len(jds)), np.empty(len(jds))
+    with sidereal(ayanamsa):
+        for i, jd in enumerate(np.asarray(jds, dtype=np.float64).tolist()):
+            cusps, ascmc, cusp_speeds, ascmc_speeds = swe.houses_ex2(jd, lat, lon, b'A', swe.FLG_SIDEREAL)
+            asc[i], speed[i] = ascmc[0], ascmc_speeds[0]
+    return asc, speed
+
+def _division_label(longitude, division):
+    bounds, labels = TRANSIT_DIVISIONS[division]
+    return labels[(np.searchsorted(bounds, longitude % 360, side="right") - 1) % len(bounds)]
+
+def _scan_boundaries(values, grid, divisions):
+    """
+    Crossings of the given TRANSIT_DIVISIONS by the angle values(jds) over
+    `grid`, as (jd, division, from, to) tuples. Boundaries shared between
+    divisions (a rasi edge is also a navamsa, pada and KP sub edge) are
+    root-found once.
+    """
+    angle, _ = values(grid)
+    path = angle[0] + np.concatenate(([0.0], np.cumsum((np.diff(angle) + 180) % 360 - 180)))
+    bounds = np.unique(np.round(np.concatenate([TRANSIT_DIVISIONS[d][0] for d in divisions]), 9))
+    before, after = _boundary_count(path[:-1], bounds), _boundary_count(path[1:], bounds)
+    counts = np.abs(after - before)
+    interval = np.repeat(np.arange(len(counts)), counts)
+    j = np.minimum(before, after)[interval] + np.arange(len(interval)) - np.repeat(np.cumsum(counts) - counts, counts)
+    target = bounds[j % len(bounds)]
+    forward = path[interval + 1] > path[interval]
+    jds = _refine_roots(values, grid[interval], grid[interval + 1], target)
+    crossings = []
+    for division in divisions:
+        division_bounds, labels = TRANSIT_DIVISIONS[division]
+        k = np.searchsorted(division_bounds, target - 1e-7)
+        hit = np.isclose(division_bounds[k % len(division_bounds)], target, rtol=0, atol=1e-7)
+        entered = np.where(forward, k, k - 1) % len(division_bounds)
+        left = np.where(forward, k - 1, k) % len(division_bounds)
+        for i in np.flatnonzero(hit).tolist():
+            crossings.append((jds[i].item(), division, labels[left[i]], labels[entered[i]]))
+    return crossings
+
+def rectification_scan(start_jd, end_jd, lat, lon, ayanamsa=DEFAULT_AYANAMSA, step=RECTIFY_STEP):
+    """
+    Every instant between two Julian days (UT) at which the Lagna changes
+    rasi, navamsa, pada or KP sub, or the Moon changes pada, as
+    {"boundaries": [{"jd", "body", "division", "from", "to"}],
+     "segments": [{"start", "end", "signature"}]}, both in time order.
+    Ascendants are sampled every `step` days with swe.houses_ex2 and each
+    crossing is root-found from its bracket using the ascendant's rate, so a
+    two-hour window takes a few hundred house calls. A segment's signature is
+    the chart between two consecutive boundaries: the Lagna's rasi, navamsa,
+    pada and KP sub and the Moon's pada.
+    """
+    grid = np.append(np.arange(start_jd, end_jd, step), end_jd)
+    movers = {
+        "Lagna": lambda jds: _ascendants(jds, lat, lon, ayanamsa),
+        "Moon": lambda jds: _body_longitudes(1, jds, ayanamsa),
+    }
+    boundaries = sorted(
+        ({"jd": jd, "body": body, "division": division, "from": left, "to": entered}
+         for body, divisions in RECTIFY_DIVISIONS.items()
+         for jd, division, left, entered in _scan_boundaries(movers[body], grid, divisions)),
+        key=lambda b: b["jd"],
+    )
+    edges = np.unique([start_jd] + [b["jd"] for b in boundaries] + [end_jd])
+    mids = (edges[:-1] + edges[1:]) / 2
+    lagna, moon = movers["Lagna"](mids)[0], movers["Moon"](mids)[0]
+    segments = []
+    for start, end, asc, moon_lon in zip(edges[:-1].tolist(), edges[1:].tolist(), lagna.tolist(), moon.tolist()):
+        signature = {f"lagna_{d}": _division_label(asc, d) for d in RECTIFY_DIVISIONS["Lagna"]}
+        signature["moon_pada"] = _division_label(moon_lon, "pada")
+        segments.append({"start": start, "end": end, "signature": signature})
+    return {"boundaries": boundaries, "segments": segments}
+
+@bp.route("/rectify")
+def rectify():
+    """
+    ?date=YYYY-MM-DD&from=HH:MM&to=HH:MM&location= (or lat=&lon=), optional
+    tz= and ayanamsa=; a `to` at or before `from` runs into the next day.
+    """
+    args = request.args
+    ayanamsa = args.get("ayanamsa", DEFAULT_AYANAMSA)
+    try:
+        start_local = parse_birth_datetime(args.get("date", ""), args.get("from", "00:00"))
+        end_local = parse_birth_datetime(args.get("date", ""), args.get("to", "23:59"))
+        if end_local <= start_local:
+            end_local += timedelta(days=1)
+        if ayanamsa not in AYANAMSAS:
+            raise ValueError(f"Unknown ayanamsa {ayanamsa!r}")
+        loc = resolve_location(args.get("location"), args.get("lat"), args.get("lon"))
+        if loc is None:
+            return jsonify(error="Could not find location"), 404
+        tz_str = args.get("tz") or timezone_at(loc.latitude, loc.longitude) or "Asia/Kolkata"
+        tz = get_tz(tz_str)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    except pytz.UnknownTimeZoneError as e:
+        return jsonify(error=f"Unknown timezone {e}"), 400
+    except GeocodeUnavailable as e:
+        return jsonify(error=str(e)), 503, {"Retry-After": "5"}
+    start_jd, end_jd = (datetime_to_jd(tz.localize(t)) for t in (start_local, end_local))
+    with timed("rectify"):
+        scan = rectification_scan(start_jd, end_jd, loc.latitude, loc.longitude, ayanamsa)
+    for boundary in scan["boundaries"]:
+        boundary["time"] = _local_iso(boundary["jd"], tz)
+    for segment in scan["segments"]:
+        segment["from"], segment["to"] = _local_iso(segment["start"], tz), _local_iso(segment["end"], tz)
+    return jsonify(place=loc.address, latitude=loc.latitude, longitude=loc.longitude, tz=tz_str,
+                   ayanamsa=ayanamsa, **scan)
+
+def get_birthchart_full_output(dob, tob, place, query_datetime, ayanamsa=DEFAULT_AYANAMSA):
     """
     Returns a dict with all major birth chart, house, planet, dasa, and maandi details.
-    dob: 'YYYY-MM-DD'
+    dob: 'YYYY-MM-DD' (or 'DD/MM/YYYY')
     tob: 'HH:MM'
-    place: city/town/village string
+    place: city/town/village string, or "lat, lon"
     query_datetime: datetime object (for dasa calculation as of today)
+    ayanamsa: key of AYANAMSAS
     """
-    from geopy.geocoders import Nominatim
-    from timezonefinder import TimezoneFinder
-    import pytz
-
     # Parse input
-    geolocator = Nominatim(user_agent="astro_kp_app")
-    loc = geolocator.geocode(place)
+    with timed("geocode"):
+        loc = resolve_location(place)
     if not loc:
         raise Exception("Could not find location. Please enter a valid city/town/village.")
     lat, lon = loc.latitude, loc.longitude
-    tf = TimezoneFinder()
-    tz_str = tf.timezone_at(lat=lat, lng=lon) or "Asia/Kolkata"
-    dt = pytz.timezone(tz_str).localize(datetime.strptime(f"{dob} {tob}", "%d/%m/%Y %H:%M"))
-
-    weekday = dt.weekday()
-    weekday = (weekday + 1) % 7
-    hour = dt.hour
-    minute = dt.minute
-    jd, dt, ut_dt = get_julian_day(dt.year, dt.month, dt.day, dt.hour, dt.minute, dt.second, tz_str)
-    ascendant, house_cusps = get_ascendant_and_houses(jd, lat, lon)
-    planet_positions = get_planet_positions(jd)
-    sun_long = planet_positions["Sun"]
-    maandi_long = get_maandi_longitude(sun_long, weekday, hour, minute, dt, lat, lon)
-    planet_table = get_full_planet_table(planet_positions, ascendant, maandi_long)
-    bhava_table = get_bhava_table(ascendant, planet_positions, maandi_long)
+    with timed("timezone"):
+        tz_str = timezone_at(lat, lon) or "Asia/Kolkata"
+    local = parse_birth_datetime(dob, tob)
+    jd, dt, ut_dt = get_julian_day(local.year, local.month, local.day, local.hour, local.minute, local.second, tz_str)
+    with timed("ephemeris"):
+        ascendant, house_cusps = get_ascendant_and_houses(jd, lat, lon, ayanamsa)
+        planet_positions = get_planet_positions(jd, ayanamsa)
+    with timed("maandi"):
+        maandi_long = get_maandi_longitude(jd, lat, lon, ayanamsa)
+    with timed("tables"):
+        planet_table = get_full_planet_table(planet_positions, ascendant, maandi_long)
+        bhava_table = get_bhava_table(ascendant, planet_positions, maandi_long)
+        ashtakavarga = calculate_ashtakavarga(planet_positions, ascendant)
+        kp = kp_table(planet_positions, house_cusps)
     moon_long = planet_positions["Moon"]
-    vim_tree = vimshottari_tree(moon_long, dt, levels=3) # Dasa, Bhukti, Antar
     # Find dasa, bhukti, antar at query_datetime
-    dasa = bhukti = antar = None
-    for d in vim_tree:
-        if d["start"] <= query_datetime <= d["end"]:
-            dasa = d["lord"]
-            for b in d["children"]:
-                if b["start"] <= query_datetime <= b["end"]:
-                    bhukti = b["lord"]
-                    for a in b["children"]:
-                        if a["start"] <= query_datetime <= a["end"]:
-                            antar = a["lord"]
-                            break
-                    break
-            break
+    with timed("dasha"):
+        periods = vimshottari_period_at(moon_long, dt, query_datetime, depth=3) or []
+    dasa, bhukti, antar = ([p["lord"] for p in periods] + [None, None, None])[:3]
 
     # Compose output
     output = {
@@ -607,14 +2425,927 @@ def get_birthchart_full_output(dob, tob, place, query_datetime):
         "maandi_degree": format_rasi_dms(maandi_long),
         "planets_table": planet_table,
         "houses": bhava_table,
+        "ashtakavarga": ashtakavarga,
+        "kp": kp,
         "dasa": dasa,
         "bhukti": bhukti,
         "antar": antar
     }
     return output
 
+# --- batch ---
+BATCH_FIELDS = ["id", "dob", "tob", "place", "lat", "lon", "tz"]
+_UNRESOLVED = object()
+
+def parse_birth_datetime(dob, tob):
+    for date_fmt in ("%Y-%m-%d", "%d/%m/%Y"):
+        for time_fmt in ("%H:%M", "%H:%M:%S"):
+            try:
+                return datetime.strptime(f"{dob.strip()} {tob.strip()}", f"{date_fmt} {time_fmt}")
+            except ValueError:
+                pass
+    raise ValueError(f"Unrecognised date/time {dob!r} {tob!r}; expected YYYY-MM-DD (or DD/MM/YYYY) and HH:MM")
+
+def describe_placement(longitude):
+    _, rasi = get_rasi_from_longitude(longitude)
+    _, navamsa = get_navamsa_rasi(longitude)
+    nakshatra, pada = get_nakshatra_pada(longitude)
+    return {"longitude": longitude, "rasi": rasi, "navamsa": navamsa, "nakshatra": nakshatra, "pada": pada}
+
+def compute_chart_record(dob, tob, lat, lon, tz_str, ayanamsa=DEFAULT_AYANAMSA):
+    """
+    JSON-ready chart summary for coordinates that are already resolved:
+    placements of Lagna, the planets and Maandi, and the mahadasha sequence.
+    """
+    local = parse_birth_datetime(dob, tob)
+    jd, dt, ut_dt = get_julian_day(local.year, local.month, local.day, local.hour, local.minute, local.second, tz_str)
+    ascendant, house_cusps = get_ascendant_and_houses(jd, lat, lon, ayanamsa)
+    planet_positions = get_planet_positions(jd, ayanamsa)
+    maandi_long = get_maandi_longitude(jd, lat, lon, ayanamsa)
+    bodies = {"Lagna": ascendant, **planet_positions, "Maandi": maandi_long}
+    dashas = VimshottariArrays(planet_positions["Moon"], dt, levels=1)
+    return {
+        "birth": dt.isoformat(),
+        "jd": jd,
+        "latitude": lat,
+        "longitude": lon,
+        "tz": tz_str,
+        "ayanamsa": ayanamsa,
+        "placements": {name: describe_placement(lon_) for name, lon_ in bodies.items()},
+        "dasha": [
+            {
+                "lord": p.lord,
+                "start": p.start.strftime("%Y-%m-%d"),
+                "end": p.end.strftime("%Y-%m-%d"),
+                "start_jd": p.start_jd,
+                "end_jd": p.end_jd
+            }
+            for p in dashas
+        ]
+    }
+
+def read_batch_rows(lines, fmt="csv"):
+    """
+    Rows from CSV (header naming BATCH_FIELDS columns) or JSONL, read lazily.
+    Each row needs dob and tob plus either place or lat/lon (tz optional).
+    """
+    if fmt == "jsonl":
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+    else:
+        yield from csv.DictReader(lines)
+
+class BatchResolver:
+    """
+    Resolves batch rows to (lat, lon, tz), geocoding each distinct place once.
+    """
+    def __init__(self, cache_size=65536):
+        self.places = LRUCache(cache_size)
+
+    def resolve(self, row):
+        lat, lon = row.get("lat"), row.get("lon")
+        if lat not in (None, "") and lon not in (None, ""):
+            lat, lon = float(lat), float(lon)
+        else:
+            key = normalize_place(row.get("place"))
+            loc = self.places.get(key, _UNRESOLVED)
+            if loc is _UNRESOLVED:
+                loc = geocoder.geocode(key) if key else None
+                self.places.put(key, loc)
+            if loc is None:
+                raise ValueError(f"Could not find location {row.get('place')!r}")
+            lat, lon = loc.latitude, loc.longitude
+        tz_str = row.get("tz") or timezone_at(lat, lon) or "Asia/Kolkata"
+        return lat, lon, tz_str
+
+def _compute_batch_chunk(tasks, ayanamsa):
+    records = []
+    for row_id, dob, tob, lat, lon, tz_str in tasks:
+        try:
+            record = compute_chart_record(dob, tob, lat, lon, tz_str, ayanamsa)
+            record["id"] = row_id
+        except Exception as e:
+            record = {"id": row_id, "error": str(e)}
+        records.append(record)
+    return records
+
+class BatchProgress:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.done = 0
+        self.errors = 0
+
+    def update(self, records):
+        self.done += len(records)
+        self.errors += sum("error" in r for r in records)
+
+    @property
+    def rate(self):
+        elapsed = time.monotonic() - self.started
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    def __str__(self):
+        return f"{self.done} charts, {self.errors} errors, {self.rate:.0f} charts/s"
+
+def iter_batch_charts(rows, workers=None, chunk_size=256, max_pending=None, progress=None,
+                      ayanamsa=DEFAULT_AYANAMSA):
+    """
+    Computes chart records for `rows` on a process pool and yields them as
+    chunks finish (completion order, each record carries its row id).
+    Geocoding and timezone lookups happen once per distinct place in this
+    process; only max_pending chunks are in flight at a time, so memory
+    stays bounded however long the input is.
+    """
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or 2 * workers
+    resolver = BatchResolver()
+    progress = progress if progress is not None else BatchProgress()
+
+    def finished(futures):
+        for future in futures:
+            records = future.result()
+            progress.update(records)
+            yield from records
+
+    with ProcessPoolExecutor(workers) as pool:
+        pending = set()
+        row_iter = enumerate(rows, start=1)
+        while True:
+            tasks, failed = [], []
+            for n, row in islice(row_iter, chunk_size):
+                row_id = row.get("id") or n
+                try:
+                    tasks.append((row_id, row["dob"], row["tob"], *resolver.resolve(row)))
+                except (KeyError, ValueError, GeocodeUnavailable) as e:
+                    failed.append({"id": row_id, "error": str(e)})
+            if not tasks and not failed:
+                break
+            if failed:
+                progress.update(failed)
+                yield from failed
+            if tasks:
+                pending.add(pool.submit(_compute_batch_chunk, tasks, ayanamsa))
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                yield from finished(done)
+        yield from finished(as_completed(pending))
+
+@bp.route("/batch", methods=["POST"])
+def batch():
+    fmt = "jsonl" if "json" in (request.mimetype or "") else "csv"
+    lines = io.TextIOWrapper(request.stream, encoding="utf-8", newline="")
+    workers = int(os.environ.get("BATCH_WORKERS", 0)) or None
+    ayanamsa = request.args.get("ayanamsa", DEFAULT_AYANAMSA)
+    if ayanamsa not in AYANAMSAS:
+        return jsonify(error=f"Unknown ayanamsa {ayanamsa!r}"), 400
+    store = request.args.get("store") in ("1", "true")
+    if store and chart_store is None:
+        return jsonify(error="No chart store configured (set CHART_STORE_PATH)"), 400
+
+    def generate():
+        records = iter_batch_charts(read_batch_rows(lines, fmt), workers=workers, ayanamsa=ayanamsa)
+        if store:
+            records = chart_store.ingesting(records)
+        for record in records:
+            yield json.dumps(record, separators=(",", ":")) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+# --- chart store ---
+STORE_BODIES = ["Lagna"] + PLANET_NAMES
+# query parameter -> (column, labels) for the indexed placements
+STORE_FILTERS = {
+    "moon_nakshatra": ("moon_nakshatra", NAKSHATRA_NAMES),
+    **{body.lower(): (f"{body.lower()}_rasi", RASI_LABELS) for body in STORE_BODIES},
+}
+STORE_QUERY_LIMIT = 1000
+
+class ChartStore:
+    """
+    Saved charts in SQLite: the normalized inputs (birth time with offset,
+    coordinates, timezone, ayanamsa) and the longitudes of Lagna and the
+    planets, with indexed rasi columns for each body, the Moon's nakshatra
+    and every mahadasha start. Ingest takes chart records as produced by
+    compute_chart_record (the batch path); query() filters on any mix of
+    placements and a mahadasha starting in a date range, paging by id.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        longitudes = ", ".join(f"{body.lower()}_lon REAL" for body in STORE_BODIES)
+        rasis = ", ".join(f"{body.lower()}_rasi INTEGER" for body in STORE_BODIES)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode = WAL")
+            self._conn.execute("PRAGMA synchronous = NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS charts (id INTEGER PRIMARY KEY, ref TEXT, birth TEXT, jd REAL, "
+                f"latitude REAL, longitude REAL, tz TEXT, ayanamsa TEXT, {longitudes}, {rasis}, "
+                "moon_nakshatra INTEGER, moon_pada INTEGER)"
+            )
+            # one row per mahadasha, clustered by lord and start for "whose X dasha starts when"
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS mahadashas (lord INTEGER, start_jd REAL, chart_id INTEGER, end_jd REAL, "
+                "PRIMARY KEY (lord, start_jd, chart_id)) WITHOUT ROWID"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS ix_mahadashas_start ON mahadashas (start_jd)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS ix_charts_moon ON charts (moon_nakshatra, lagna_rasi)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS ix_charts_ref ON charts (ref)")
+            for body in STORE_BODIES:
+                column = f"{body.lower()}_rasi"
+                self._conn.execute(f"CREATE INDEX IF NOT EXISTS ix_charts_{column} ON charts ({column})")
+        self._insert = (
+            f"INSERT INTO charts (id, ref, birth, jd, latitude, longitude, tz, ayanamsa, "
+            f"{', '.join(f'{b.lower()}_lon' for b in STORE_BODIES)}, "
+            f"{', '.join(f'{b.lower()}_rasi' for b in STORE_BODIES)}, moon_nakshatra, moon_pada) "
+            f"VALUES ({', '.join(['?'] * (10 + 2 * len(STORE_BODIES)))})"
+        )
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM charts").fetchone()[0]
+
+    def _chart_row(self, chart_id, record):
+        longitudes = [record["placements"][body]["longitude"] for body in STORE_BODIES]
+        moon = record["placements"]["Moon"]["longitude"]
+        ref = record.get("id")
+        return ((chart_id, None if ref is None else str(ref), record["birth"], record["jd"], record["latitude"],
+                 record["longitude"], record["tz"], record["ayanamsa"], *longitudes,
+                 *(int(lon // 30) % 12 for lon in longitudes), int(moon * 27 // 360) % 27, int(moon * 0.3) % 108))
+
+    def ingest(self, records):
+        """
+        Stores chart records (error records are skipped) in one transaction
+        and returns their new ids, in order.
+        """
+        records = [record for record in records if "error" not in record]
+        with self._lock, self._conn:
+            # take the write lock before reading MAX(id), so other processes cannot pick the same ids
+            self._conn.execute("BEGIN IMMEDIATE")
+            first = self._conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM charts").fetchone()[0]
+            ids = range(first, first + len(records))
+            self._conn.executemany(self._insert, map(self._chart_row, ids, records))
+            self._conn.executemany("INSERT INTO mahadashas VALUES (?, ?, ?, ?)", (
+                (VIM_SEQ.index(d["lord"]), d["start_jd"], chart_id, d["end_jd"])
+                for chart_id, record in zip(ids, records) for d in record["dasha"]
+            ))
+        return list(ids)
+
+    def ingesting(self, records, chunk_size=1000):
+        """
+        Passes `records` through unchanged while storing them every
+        chunk_size records, so a streamed batch is saved as it goes.
+        """
+        pending = []
+        for record in records:
+            pending.append(record)
+            yield record
+            if len(pending) >= chunk_size:
+                self.ingest(pending)
+                pending = []
+        if pending:
+            self.ingest(pending)
+
+    def query(self, filters=None, dasha_lord=None, dasha_start=None, dasha_end=None, limit=100, after=0):
+        """
+        Charts matching every {STORE_FILTERS key: label} filter (e.g.
+        {"moon_nakshatra": "Rohini", "lagna": "Simha"}) and, with dasha_lord
+        and/or a start range in Julian days, having a mahadasha that starts
+        within it (the earliest such one is reported). Returns up to `limit`
+        rows with id > after, in id order.
+        """
+        where, params = ["c.id > ?"], [after]
+        for key, label in (filters or {}).items():
+            if key not in STORE_FILTERS:
+                raise ValueError(f"Unknown filter {key!r}; expected one of {', '.join(STORE_FILTERS)}")
+            column, labels = STORE_FILTERS[key]
+            if label not in labels:
+                raise ValueError(f"Unknown {key} {label!r}")
+            where.append(f"c.{column} = ?")
+            params.append(labels.index(label))
+        dasha = dasha_lord is not None or dasha_start is not None or dasha_end is not None
+        if dasha_lord is not None:
+            if dasha_lord not in VIM_SEQ:
+                raise ValueError(f"Unknown dasha lord {dasha_lord!r}")
+            where.append("d.lord = ?")
+            params.append(VIM_SEQ.index(dasha_lord))
+        if dasha_start is not None:
+            where.append("d.start_jd >= ?")
+            params.append(dasha_start)
+        if dasha_end is not None:
+            where.append("d.start_jd < ?")
+            params.append(dasha_end)
+        columns = "c.id, c.ref, c.birth, c.jd, c.latitude, c.longitude, c.tz, c.ayanamsa, " + ", ".join(
+            f"c.{body.lower()}_lon" for body in STORE_BODIES)
+        # with a dasha condition, walk the mahadasha range first (CROSS JOIN fixes the order)
+        sql = (f"SELECT {columns}{', d.lord, MIN(d.start_jd), d.end_jd' if dasha else ''} FROM "
+               f"{'mahadashas d CROSS JOIN charts c ON c.id = d.chart_id' if dasha else 'charts c'} "
+               f"WHERE {' AND '.join(where)}{' GROUP BY c.id' if dasha else ''} ORDER BY c.id LIMIT ?")
+        with self._lock:
+            rows = self._conn.execute(sql, params + [limit]).fetchall()
+        results = []
+        for row in rows:
+            chart_id, ref, birth, jd, lat, lon, tz_str, ayanamsa = row[:8]
+            result = {
+                "id": chart_id, "ref": ref, "birth": birth, "jd": jd, "latitude": lat, "longitude": lon,
+                "tz": tz_str, "ayanamsa": ayanamsa,
+                "placements": {body: describe_placement(x) for body, x in zip(STORE_BODIES, row[8:8 + len(STORE_BODIES)])},
+            }
+            if dasha:
+                lord, start_jd, end_jd = row[8 + len(STORE_BODIES):]
+                result["mahadasha"] = {"lord": VIM_SEQ[lord], "start": jd_to_datetime(start_jd).strftime("%Y-%m-%d"),
+                                       "end": jd_to_datetime(end_jd).strftime("%Y-%m-%d")}
+            results.append(result)
+        return results
+
+    def optimize(self):
+        # refresh the planner statistics after a large ingest
+        with self._lock:
+            self._conn.execute("PRAGMA optimize")
+
+CHART_STORE_PATH = os.environ.get("CHART_STORE_PATH")
+chart_store = ChartStore(CHART_STORE_PATH) if CHART_STORE_PATH else None
+
+# --- panchanga ---
+TITHI_NAMES = ["Pratipada", "Dwitiya", "Tritiya", "Chaturthi", "Panchami", "Shashthi", "Saptami",
+               "Ashtami", "Navami", "Dashami", "Ekadashi", "Dwadashi", "Trayodashi", "Chaturdashi"]
+TITHIS = ([f"Shukla {name}" for name in TITHI_NAMES] + ["Purnima"]
+          + [f"Krishna {name}" for name in TITHI_NAMES] + ["Amavasya"])
+KARANAS = (["Kimstughna"] + [("Bava", "Balava", "Kaulava", "Taitila", "Garaja", "Vanija", "Vishti")[i % 7]
+                             for i in range(56)] + ["Shakuni", "Chatushpada", "Naga"])
+YOGA_NAMES = [
+    "Vishkambha", "Priti", "Ayushman", "Saubhagya", "Shobhana", "Atiganda", "Sukarma", "Dhriti", "Shoola",
+    "Ganda", "Vriddhi", "Dhruva", "Vyaghata", "Harshana", "Vajra", "Siddhi", "Vyatipata", "Variyan",
+    "Parigha", "Shiva", "Siddha", "Sadhya", "Shubha", "Shukla", "Brahma", "Indra", "Vaidhriti"
+]
+VARA_NAMES = ("Ravivara", "Somavara", "Mangalavara", "Budhavara", "Guruvara", "Shukravara", "Shanivara")
+RAHU_KALAM_PART = (7, 1, 6, 4, 5, 3, 2)  # eighth of the daytime, from 0, Sunday first
+# element: (angle, degrees per element, names); the angles only ever increase
+PANCHANGA_ELEMENTS = {
+    "tithi": ("elongation", 12.0, TITHIS),
+    "nakshatra": ("moon", 40 / 3, NAKSHATRA_NAMES),
+    "yoga": ("sum", 40 / 3, YOGA_NAMES),
+    "karana": ("elongation", 6.0, KARANAS),
+}
+PANCHANGA_FIELDS = ["date", "vara", "sunrise", "sunset", "rahu_kalam_start", "rahu_kalam_end"] + [
+    f"{element}{suffix}" for element in PANCHANGA_ELEMENTS for suffix in ("", "_end")
+]
+
+def _panchanga_angle(angle, jds, table):
+    # Moon, Moon - Sun or Moon + Sun longitude and its rate, degrees and degrees/day
+    lon, speed = table.interpolate(jds, slice(0, 2))
+    if angle == "moon":
+        return lon[:, 1], speed[:, 1]
+    if angle == "elongation":
+        return (lon[:, 1] - lon[:, 0]) % 360, speed[:, 1] - speed[:, 0]
+    return (lon[:, 1] + lon[:, 0]) % 360, speed[:, 1] + speed[:, 0]
+
+def panchanga_transitions(start_jd, end_jd, ayanamsa=DEFAULT_AYANAMSA, step=1.0):
+    """
+    {element: (jds, indices)} for each PANCHANGA_ELEMENTS entry: jds[0] is
+    start_jd and indices[0] the element running then, followed by the exact
+    instant (UT) each later element begins before end_jd. Sun and Moon come
+    from the loaded ephemeris table when it covers the range, otherwise from
+    a one-day table built for it; every boundary between the `step`-day
+    samples is then root-found on the Hermite interpolant, which puts the
+    times within about a second of exact.
+    """
+    table = ephemeris_table
+    if table is None or table.ayanamsa != ayanamsa or not table.covers([start_jd, end_jd]):
+        table = EphemerisTable.build(start_jd - 1, end_jd + 1, 1.0, ayanamsa)
+    grid = np.append(np.arange(start_jd, end_jd, step), end_jd)
+    out = {}
+    for element, (angle, size, names) in PANCHANGA_ELEMENTS.items():
+        values = _panchanga_angle(angle, grid, table)[0]
+        path = values[0] + np.concatenate(([0.0], np.cumsum(np.diff(values) % 360)))
+        count = np.floor(path / size).astype(np.int64)
+        crossings = np.diff(count)
+        interval = np.repeat(np.arange(len(crossings)), crossings)
+        j = count[interval] + 1 + np.arange(len(interval)) - np.repeat(np.cumsum(crossings) - crossings, crossings)
+        jds = _refine_roots(lambda t: _panchanga_angle(angle, t, table), grid[interval], grid[interval + 1],
+                            (j * size) % 360)
+        out[element] = (np.concatenate(([start_jd], jds)), np.concatenate(([count[0]], j)) % len(names))
+    return out
+
+def _local_iso(jd, tz):
+    seconds = round((jd - UNIX_EPOCH_JD) * 86400)
+    return (datetime(1970, 1, 1, tzinfo=pytz.utc) + timedelta(seconds=seconds)).astimezone(tz).isoformat()
+
+def panchanga_year(year, lat, lon, tz_str, ayanamsa=DEFAULT_AYANAMSA):
+    """
+    Yields one dict per civil day of `year` at a location: date, vara,
+    sunrise, sunset, Rahu kalam, and for tithi, nakshatra, yoga and karana
+    every element running between that sunrise and the next, as
+    [{"name", "end"}], the one at sunrise first. Times are ISO 8601 in the
+    location's timezone.
+    """
+    tz = get_tz(tz_str)
+    sun = sun_times_year(year, lat, lon)
+    # a nakshatra can outlast a day, so search far enough past the last sunrise to see it end
+    transitions = panchanga_transitions(sun[0, 0] - 1, sun[-1, 2] + 2, ayanamsa)
+    spans = {}
+    for element, (jds, indices) in transitions.items():
+        first = np.searchsorted(jds, sun[:, 0], side="right") - 1
+        last = np.searchsorted(jds, sun[:, 2], side="left")
+        names = PANCHANGA_ELEMENTS[element][2]
+        labels = [names[i] for i in indices.tolist()]
+        ends = [_local_iso(jd, tz) for jd in jds[1:].tolist()]
+        spans[element] = (first.tolist(), last.tolist(), labels, ends)
+    for d, (sunrise, sunset, next_sunrise) in enumerate(sun.tolist()):
+        weekday = (_local_day(sunrise, lon) + 1) % 7
+        part = (sunset - sunrise) / 8
+        rahu_start = sunrise + RAHU_KALAM_PART[weekday] * part
+        day = {
+            "date": jd_to_datetime(sunrise, tz).strftime("%Y-%m-%d"),
+            "vara": VARA_NAMES[weekday],
+            "sunrise": _local_iso(sunrise, tz),
+            "sunset": _local_iso(sunset, tz),
+            "rahu_kalam": [_local_iso(rahu_start, tz), _local_iso(rahu_start + part, tz)],
+        }
+        for element, (first, last, labels, ends) in spans.items():
+            day[element] = [{"name": labels[i], "end": ends[i]} for i in range(first[d], last[d])]
+        yield day
+
+def panchanga_csv_row(day):
+    row = {key: day[key] for key in ("date", "vara", "sunrise", "sunset")}
+    row["rahu_kalam_start"], row["rahu_kalam_end"] = day["rahu_kalam"]
+    for element in PANCHANGA_ELEMENTS:
+        row[element] = ";".join(e["name"] for e in day[element])
+        row[f"{element}_end"] = ";".join(e["end"] for e in day[element])
+    return row
+
+def check_panchanga_year(year, ayanamsa=DEFAULT_AYANAMSA):
+    """
+    Raises ValueError unless the installed ephemeris files cover `year`,
+    with the margins panchanga_year searches beyond it.
+    """
+    if not 1 <= year <= 9998:
+        raise ValueError(f"year must be 1 to 9998, got {year}")
+    try:
+        with sidereal(ayanamsa):
+            for jd in (swe.julday(year - 1, 12, 29, 0.0), swe.julday(year + 1, 1, 4, 0.0)):
+                swe.calc_ut(jd, swe.MOON, swe.FLG_SIDEREAL)
+    except swe.Error as e:
+        raise ValueError(f"year {year} is outside the installed ephemeris ({e})") from None
+
+def _panchanga_city(city, year, ayanamsa):
+    days = list(panchanga_year(year, city["lat"], city["lon"], city["tz"], ayanamsa))
+    for day in days:
+        day["city"] = city["name"]
+    return days
+
+def iter_panchanga_cities(cities, year, workers=None, max_pending=None, ayanamsa=DEFAULT_AYANAMSA):
+    """
+    Yearly panchanga for each {"name", "lat", "lon", "tz"} city, computed on
+    a process pool and yielded city by city as they finish; every day dict
+    carries its "city". A city given with an "error" instead of coordinates
+    comes out as one {"city", "error"} record. At most max_pending cities
+    are in flight.
+    """
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or 2 * workers
+    def finished(futures):
+        for future in futures:
+            try:
+                yield from future.result()
+            except Exception as e:
+                yield {"city": names.pop(future), "error": str(e)}
+
+    with ProcessPoolExecutor(workers) as pool:
+        pending, names = set(), {}
+        for city in cities:
+            if "error" in city:
+                yield {"city": city["name"], "error": city["error"]}
+                continue
+            future = pool.submit(_panchanga_city, city, year, ayanamsa)
+            pending.add(future)
+            names[future] = city["name"]
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                yield from finished(done)
+        yield from finished(as_completed(pending))
+
+def _stream_panchanga(days, fmt, with_city=False):
+    if fmt == "jsonl":
+        for day in days:
+            yield json.dumps(day, separators=(",", ":")) + "\n"
+        return
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, ["city"] + PANCHANGA_FIELDS + ["error"] if with_city else PANCHANGA_FIELDS)
+    writer.writeheader()
+    for day in days:
+        row = day if "error" in day else panchanga_csv_row(day)
+        if with_city:
+            row["city"] = day["city"]
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+PANCHANGA_MIMETYPES = {"csv": "text/csv", "jsonl": "application/x-ndjson"}
+
+@bp.route("/panchanga", methods=["GET", "POST"])
+def panchanga():
+    """
+    GET ?year=&location= (or lat=&lon=)&format=csv|jsonl streams one city's
+    year. POST a CSV or JSONL list of cities (name, place or lat/lon, tz) to
+    stream every city's year, computed in parallel.
+    """
+    fmt = request.args.get("format", "csv")
+    ayanamsa = request.args.get("ayanamsa", DEFAULT_AYANAMSA)
+    try:
+        year = int(request.args.get("year", datetime.now(pytz.utc).year))
+        if fmt not in PANCHANGA_MIMETYPES:
+            raise ValueError(f"format must be one of {', '.join(PANCHANGA_MIMETYPES)}")
+        if ayanamsa not in AYANAMSAS:
+            raise ValueError(f"Unknown ayanamsa {ayanamsa!r}")
+        check_panchanga_year(year, ayanamsa)
+        if request.method == "GET":
+            loc = resolve_location(request.args.get("location"), request.args.get("lat"), request.args.get("lon"))
+            if loc is None:
+                return jsonify(error="Could not find location"), 404
+            tz_str = request.args.get("tz") or timezone_at(loc.latitude, loc.longitude) or "Asia/Kolkata"
+            get_tz(tz_str)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    except pytz.UnknownTimeZoneError as e:
+        return jsonify(error=f"Unknown timezone {e}"), 400
+    except GeocodeUnavailable as e:
+        return jsonify(error=str(e)), 503, {"Retry-After": "5"}
+
+    if request.method == "GET":
+        days = panchanga_year(year, loc.latitude, loc.longitude, tz_str, ayanamsa)
+        return Response(stream_with_context(_stream_panchanga(days, fmt)), mimetype=PANCHANGA_MIMETYPES[fmt])
+
+    lines = io.TextIOWrapper(request.stream, encoding="utf-8", newline="")
+    row_fmt = "jsonl" if "json" in (request.mimetype or "") else "csv"
+    workers = int(os.environ.get("BATCH_WORKERS", 0)) or None
+
+    def cities():
+        resolver = BatchResolver()
+        for n, row in enumerate(read_batch_rows(lines, row_fmt), start=1):
+            name = row.get("name") or row.get("place") or str(n)
+            try:
+                lat, lon, tz_str = resolver.resolve(row)
+                get_tz(tz_str)
+            except (ValueError, GeocodeUnavailable) as e:
+                yield {"name": name, "error": str(e)}
+                continue
+            except pytz.UnknownTimeZoneError as e:
+                yield {"name": name, "error": f"Unknown timezone {e}"}
+                continue
+            yield {"name": name, "lat": lat, "lon": lon, "tz": tz_str}
+
+    days = iter_panchanga_cities(cities(), year, workers=workers, ayanamsa=ayanamsa)
+    return Response(stream_with_context(_stream_panchanga(days, fmt, with_city=True)),
+                    mimetype=PANCHANGA_MIMETYPES[fmt])
+
+# --- chart API ---
+API_VERSION = 1
+API_SECTIONS = ("planets", "houses", "vargas", "ashtakavarga", "kp", "dasha")
+API_DEFAULT_DEPTH = 2
+API_MEDIA_TYPES = ("application/json", "application/msgpack", "application/x-msgpack")
+
+_PLACEMENT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "longitude": {"type": "number", "description": "sidereal longitude, degrees"},
+        "rasi": {"type": "string"}, "navamsa": {"type": "string"},
+        "nakshatra": {"type": "string"}, "pada": {"type": "integer", "minimum": 1, "maximum": 4},
+    },
+    "required": ["longitude", "rasi", "navamsa", "nakshatra", "pada"],
+}
+_PERIOD_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "lord": {"enum": VIM_SEQ},
+        "start": {"type": "string", "format": "date-time"},
+        "end": {"type": "string", "format": "date-time"},
+        "periods": {"type": "array", "items": {"$ref": "#/$defs/period"}, "description": "next level, if requested"},
+    },
+    "required": ["lord", "start", "end"],
+}
+_KP_LORDS_SCHEMA = {
+    "type": "object",
+    "description": "a cusp (with \"house\") or a planet (with \"planet\" and the \"house\" it occupies)",
+    "properties": {"longitude": {"type": "number"}, **{level: {"enum": PLANET_NAMES} for level in KP_LEVELS}},
+    "required": ["longitude", *KP_LEVELS],
+}
+CHART_API_SCHEMA = {
+    "$schema": "https://json-schema.org/draft/2020-12/schema",
+    "$id": "/api/v1/schema",
+    "title": "Birth chart",
+    "description": "Response of GET /api/v1/chart. Only the requested sections are present; "
+                   "times are UTC ISO 8601, longitudes sidereal for the chosen ayanamsa.",
+    "type": "object",
+    "$defs": {"placement": _PLACEMENT_SCHEMA, "period": _PERIOD_SCHEMA, "kp_lords": _KP_LORDS_SCHEMA},
+    "properties": {
+        "version": {"const": API_VERSION},
+        "input": {
+            "type": "object",
+            "properties": {
+                "birth": {"type": "string", "format": "date-time", "description": "local time with offset"},
+                "jd": {"type": "number"}, "place": {"type": "string"},
+                "latitude": {"type": "number"}, "longitude": {"type": "number"},
+                "tz": {"type": "string"}, "ayanamsa": {"enum": sorted(AYANAMSAS)},
+            },
+            "required": ["birth", "jd", "place", "latitude", "longitude", "tz", "ayanamsa"],
+        },
+        "planets": {"type": "object", "description": "Lagna, the nine grahas and Maandi",
+                    "additionalProperties": {"$ref": "#/$defs/placement"}},
+        "houses": {"type": "array", "minItems": 12, "maxItems": 12, "items": {
+            "type": "object",
+            "properties": {"house": {"type": "integer"}, "rasi": {"type": "string"},
+                           "lord": {"type": "string"}, "navamsa": {"type": "string"}},
+        }},
+        "vargas": {"type": "object", "description": "D<n> -> body -> sign",
+                   "additionalProperties": {"type": "object", "additionalProperties": {"enum": RASI_LABELS}}},
+        "ashtakavarga": {"type": "object", "properties": {
+            "bhinna": {"type": "object", "additionalProperties": {
+                "type": "array", "items": {"type": "integer"}, "minItems": 12, "maxItems": 12}},
+            "sarva": {"type": "array", "items": {"type": "integer"}, "minItems": 12, "maxItems": 12},
+        }},
+        "kp": {"type": "object", "properties": {
+            "cusps": {"type": "array", "minItems": 12, "maxItems": 12, "items": {"$ref": "#/$defs/kp_lords"}},
+            "planets": {"type": "array", "items": {"$ref": "#/$defs/kp_lords"}},
+            "significators": {"type": "array", "minItems": 12, "maxItems": 12, "items": {
+                "type": "object",
+                "properties": {"house": {"type": "integer"},
+                               **{level: {"type": "array", "items": {"enum": PLANET_NAMES}}
+                                  for level in KP_SIGNIFICATOR_LEVELS}},
+            }},
+            "planet_houses": {"type": "object", "additionalProperties": {"type": "array", "items": {"type": "integer"}}},
+        }},
+        "dasha": {"type": "object", "properties": {
+            "depth": {"type": "integer", "minimum": 1, "maximum": VIM_LEVELS},
+            "at": {"type": "string", "format": "date-time"},
+            "current": {"type": "array", "items": {"$ref": "#/$defs/period"}},
+            "periods": {"type": "array", "items": {"$ref": "#/$defs/period"}},
+        }},
+    },
+    "required": ["version", "input"],
+}
+
+def jd_to_iso(jds):
+    # UTC ISO 8601 strings to the second for an array of Julian days
+    seconds = np.round((np.asarray(jds, dtype=np.float64) - UNIX_EPOCH_JD) * 86400).astype(np.int64)
+    return np.datetime_as_string(seconds.astype("datetime64[s]"), timezone="UTC").tolist()
+
+def _iso_utc(dt):
+    return dt.astimezone(pytz.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+def dasha_document(moon_longitude, birthdt, depth, when):
+    arrays = VimshottariArrays(moon_longitude, birthdt, depth)
+    periods = []
+    for level in reversed(range(depth)):
+        starts, ends = jd_to_iso(arrays.start_jd[level]), jd_to_iso(arrays.end_jd[level])
+        lords = [VIM_SEQ[lord] for lord in arrays.lords[level].tolist()]
+        periods = [
+            {"lord": lords[i], "start": starts[i], "end": ends[i], "periods": periods[9*i:9*i + 9]}
+            if periods else {"lord": lords[i], "start": starts[i], "end": ends[i]}
+            for i in range(len(lords))
+        ]
+    current = vimshottari_period_at(moon_longitude, birthdt, when, depth) or []
+    return {
+        "depth": depth,
+        "at": _iso_utc(when),
+        "current": [{"lord": p["lord"], "start": _iso_utc(p["start"]), "end": _iso_utc(p["end"])} for p in current],
+        "periods": periods,
+    }
+
+def chart_document(local, loc, tz_str, ayanamsa=DEFAULT_AYANAMSA, sections=API_SECTIONS,
+                   depth=API_DEFAULT_DEPTH, when=None, vargas=VARGAS):
+    """
+    JSON-ready chart for the API: "version", "input" and only the requested
+    sections (see CHART_API_SCHEMA). `local` is the naive local birth time;
+    `when` (aware, default now) picks the current dasha periods.
+    """
+    lat, lon = loc.latitude, loc.longitude
+    jd, dt, ut_dt = get_julian_day(local.year, local.month, local.day, local.hour, local.minute, local.second, tz_str)
+    doc = {
+        "version": API_VERSION,
+        "input": {"birth": dt.isoformat(), "jd": jd, "place": loc.address, "latitude": lat, "longitude": lon,
+                  "tz": tz_str, "ayanamsa": ayanamsa},
+    }
+    with timed("ephemeris"):
+        ascendant, house_cusps = get_ascendant_and_houses(jd, lat, lon, ayanamsa)
+        planet_positions = get_planet_positions(jd, ayanamsa)
+    if {"planets", "vargas"} & set(sections):
+        with timed("maandi"):
+            maandi_long = get_maandi_longitude(jd, lat, lon, ayanamsa)
+    with timed("tables"):
+        if "planets" in sections:
+            doc["planets"] = {"Lagna": describe_placement(ascendant),
+                              **{p: describe_placement(v) for p, v in planet_positions.items()},
+                              "Maandi": describe_placement(maandi_long)}
+        if "houses" in sections:
+            doc["houses"] = [{k.lower(): v for k, v in h.items()}
+                             for h in get_bhava_table(ascendant, planet_positions, None)]
+        if "vargas" in sections:
+            names, longitudes = chart_bodies(planet_positions, ascendant, maandi_long)
+            signs = divisional_signs(longitudes, vargas).tolist()
+            doc["vargas"] = {f"D{n}": {name: RASI_LABELS[s] for name, s in zip(names, row)}
+                             for n, row in zip(vargas, signs)}
+        if "ashtakavarga" in sections:
+            doc["ashtakavarga"] = calculate_ashtakavarga(planet_positions, ascendant)
+        if "kp" in sections:
+            doc["kp"] = kp_table(planet_positions, house_cusps)
+    if "dasha" in sections:
+        with timed("dasha"):
+            doc["dasha"] = dasha_document(planet_positions["Moon"], dt, depth, when or datetime.now(pytz.utc))
+    return doc
+
+def _encode_api(doc, status=200):
+    """
+    Response in the best media type the client accepts: msgpack when asked for
+    and installed, otherwise JSON (through orjson when installed).
+    """
+    best = request.accept_mimetypes.best_match(API_MEDIA_TYPES, default="application/json")
+    if best != "application/json":
+        try:
+            import msgpack
+            return Response(msgpack.packb(doc), status=status, mimetype=best)
+        except ImportError:
+            if request.accept_mimetypes.quality("application/json") == 0:
+                return Response("msgpack is not available; use application/json", status=406, mimetype="text/plain")
+    try:
+        import orjson
+        body = orjson.dumps(doc)
+    except ImportError:
+        body = json.dumps(doc, separators=(",", ":"))
+    return Response(body, status=status, mimetype="application/json")
+
+@bp.route("/api/v1/schema")
+def api_schema():
+    return jsonify(CHART_API_SCHEMA)
+
+@bp.route("/api/v1/chart")
+def api_chart():
+    """
+    ?dob=YYYY-MM-DD&tob=HH:MM with location= (or lat=&lon=), and optionally
+    ayanamsa=, sections=planets,houses,... (default all), depth=1-5 for the
+    dasha levels, at=ISO time for the current dasha and vargas=D1,D9,...
+    """
+    args = request.args
+    try:
+        local = parse_birth_datetime(args.get("dob", ""), args.get("tob", ""))
+        ayanamsa = args.get("ayanamsa", DEFAULT_AYANAMSA)
+        if ayanamsa not in AYANAMSAS:
+            raise ValueError(f"Unknown ayanamsa {ayanamsa!r}; expected one of {', '.join(sorted(AYANAMSAS))}")
+        sections = [s for s in args.get("sections", ",".join(API_SECTIONS)).split(",") if s]
+        unknown = set(sections) - set(API_SECTIONS)
+        if unknown:
+            raise ValueError(f"Unknown sections {', '.join(sorted(unknown))}; expected {', '.join(API_SECTIONS)}")
+        depth = int(args.get("depth", API_DEFAULT_DEPTH))
+        if not 1 <= depth <= VIM_LEVELS:
+            raise ValueError(f"depth must be 1 to {VIM_LEVELS}")
+        when = datetime.fromisoformat(args["at"].replace("Z", "+00:00")) if args.get("at") else None
+        if when is not None and when.tzinfo is None:
+            when = pytz.utc.localize(when)
+        vargas = tuple(varga_number(v) for v in args.get("vargas", "").split(",") if v) or VARGAS
+        with timed("geocode"):
+            loc = resolve_location(args.get("location"), args.get("lat"), args.get("lon"))
+    except ValueError as e:
+        return _encode_api({"error": str(e)}, 400)
+    except GeocodeUnavailable as e:
+        response = _encode_api({"error": str(e)}, 503)
+        response.headers["Retry-After"] = "5"
+        return response
+    if loc is None:
+        return _encode_api({"error": "Could not find location"}, 404)
+    with timed("timezone"):
+        tz_str = timezone_at(loc.latitude, loc.longitude) or "Asia/Kolkata"
+    return _encode_api(chart_document(local, loc, tz_str, ayanamsa, sections, depth, when, vargas))
+
+MATCH_MAX_K = int(os.environ.get("MATCH_MAX_K", "100"))
+
+@bp.route("/api/v1/match")
+def api_match():
+    """
+    ?dob=&tob=&location= (or lat=&lon=)&sex=bride|groom, and optionally k=,
+    system=ashtakoota|porutham, min_score= and ayanamsa=: the best stored
+    profiles of the opposite sex from profile_index.
+    """
+    args = request.args
+    try:
+        local = parse_birth_datetime(args.get("dob", ""), args.get("tob", ""))
+        ayanamsa = args.get("ayanamsa", DEFAULT_AYANAMSA)
+        if ayanamsa not in AYANAMSAS:
+            raise ValueError(f"Unknown ayanamsa {ayanamsa!r}; expected one of {', '.join(sorted(AYANAMSAS))}")
+        sex = {"bride": BRIDE, "groom": GROOM}.get(args.get("sex", ""))
+        if sex is None:
+            raise ValueError("sex must be bride or groom")
+        system = args.get("system", "ashtakoota")
+        if system not in MATCH_SYSTEMS:
+            raise ValueError(f"system must be one of {', '.join(MATCH_SYSTEMS)}")
+        k = int(args.get("k", 10))
+        if not 1 <= k <= MATCH_MAX_K:
+            raise ValueError(f"k must be 1 to {MATCH_MAX_K}")
+        min_score = float(args.get("min_score", 0))
+        with timed("geocode"):
+            loc = resolve_location(args.get("location"), args.get("lat"), args.get("lon"))
+    except ValueError as e:
+        return _encode_api({"error": str(e)}, 400)
+    except GeocodeUnavailable as e:
+        response = _encode_api({"error": str(e)}, 503)
+        response.headers["Retry-After"] = "5"
+        return response
+    if loc is None:
+        return _encode_api({"error": "Could not find location"}, 404)
+    with timed("timezone"):
+        tz_str = timezone_at(loc.latitude, loc.longitude) or "Asia/Kolkata"
+    jd, dt, ut_dt = get_julian_day(local.year, local.month, local.day, local.hour, local.minute, local.second, tz_str)
+    with timed("ephemeris"):
+        moon = get_planet_positions(jd, ayanamsa)["Moon"]
+    with timed("match"):
+        matches = profile_index.top_matches(moon, sex, k, system, min_score)
+    return _encode_api({
+        "version": API_VERSION,
+        "system": system,
+        "moon": describe_placement(moon),
+        "profiles": len(profile_index),
+        "matches": matches,
+    })
+
+@bp.route("/api/v1/charts")
+def api_charts():
+    """
+    Saved charts filtered by placement, e.g. ?moon_nakshatra=Rohini&lagna=Simha
+    or ?saturn=Kumbha, and/or by a mahadasha start:
+    ?dasha_lord=Saturn&dasha_from=YYYY-MM-DD&dasha_to=YYYY-MM-DD. Pages with
+    limit= and after=<last id>.
+    """
+    if chart_store is None:
+        return _encode_api({"error": "No chart store configured (set CHART_STORE_PATH)"}, 404)
+    args = request.args
+    try:
+        filters = {key: args[key] for key in STORE_FILTERS if args.get(key)}
+        dasha_start, dasha_end = (
+            datetime_to_jd(pytz.utc.localize(datetime.strptime(args[key], "%Y-%m-%d"))) if args.get(key) else None
+            for key in ("dasha_from", "dasha_to")
+        )
+        limit = int(args.get("limit", 100))
+        if not 1 <= limit <= STORE_QUERY_LIMIT:
+            raise ValueError(f"limit must be 1 to {STORE_QUERY_LIMIT}")
+        with timed("store"):
+            charts = chart_store.query(filters, args.get("dasha_lord") or None, dasha_start, dasha_end,
+                                       limit, int(args.get("after", 0)))
+    except ValueError as e:
+        return _encode_api({"error": str(e)}, 400)
+    return _encode_api({
+        "version": API_VERSION,
+        "charts": charts,
+        "next": charts[-1]["id"] if len(charts) == limit else None,
+    })
+
+# --- app factory ---
+def warm_up(app):
+    """
+    Pays the first request's one-off costs up front: timezone polygons, the
+    Swiss Ephemeris data files, the ephemeris table pages and the compiled
+    chart template.
+    """
+    get_timezone_finder().timezone_at(lat=13.08, lng=80.27)
+    jd = swe.julday(2000, 1, 1, 12.0)
+    get_ascendant_and_houses(jd, 13.08, 80.27)
+    get_planet_positions(jd)
+    get_planet_positions_array(np.array([jd]))
+    sun_times(jd, 13.08, 80.27)
+    app.jinja_env.get_template("chart.html")
+
+def create_app(warm=None):
+    """
+    Builds the Flask app. Rarely used heavy dependencies (geopy, pandas) are
+    imported on first use; `warm` (default BIRTHCHART_WARM_UP, on) runs
+    warm_up() before the app is returned.
+    """
+    app = Flask(__name__)
+    if os.environ.get("JINJA_BYTECODE_CACHE_DIR"):
+        from jinja2 import FileSystemBytecodeCache
+        app.jinja_options = {**app.jinja_options,
+                             "bytecode_cache": FileSystemBytecodeCache(os.environ["JINJA_BYTECODE_CACHE_DIR"])}
+    app.register_blueprint(bp)
+    if warm is None:
+        warm = os.environ.get("BIRTHCHART_WARM_UP", "1") == "1"
+    if warm:
+        warm_up(app)
+    return app
+
+_app_lock = threading.Lock()
+
+def __getattr__(name):
+    # `birthchart_web:app` (gunicorn, flask run) builds the app on first access, so
+    # batch workers and the CLI that only need the chart functions never pay for it
+    if name != "app":
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with _app_lock:
+        if "app" not in globals():
+            globals()["app"] = create_app()
+    return globals()["app"]
+
 # --- local runner (optional; OK to keep even on Render) ---
 if __name__ == "__main__":
-    import os
     port = int(os.environ.get("PORT", 5000))
+    app = create_app()
     app.run(host="0.0.0.0", port=port, debug=False)